@@ -11,6 +11,12 @@ from scipy.stats import norm
 
 import matplotlib.pyplot as plt
 
+from tempered_family import TemperedDistribution
+
+# Set to True to plot the normalised tempered densities (see tempered_family.py)
+# instead of the raw powers, which do not integrate to one
+NORMALISE = False
+
 
 # Generate values
 x = np.linspace(-8, 8, 1000)
@@ -25,6 +31,9 @@ pdf_01 = pdf ** 0.1
 
 pdf_005 = pdf ** 0.05
 
+if NORMALISE:
+    pdf_05, pdf_01, pdf_005 = TemperedDistribution('normal').pdf(x, [0.5, 0.1, 0.05])
+
 # Plotting
 plt.figure(figsize=(10, 6))
 plt.plot(x, pdf, label='Normal PDF')
@@ -10,6 +10,8 @@ loss, Huber loss and Tukey loss.
 import numpy as np
 import matplotlib.pyplot as plt
 
+from loss_kernels import huber_rho, tukey_rho
+
 #Squared loss function
 def squared_loss(x):
     return x ** 2
@@ -18,51 +20,33 @@ def squared_loss(x):
 def absolute_loss(x):
     return np.abs(x)
 
-#Huber loss function, with c as a parameter
+#Huber loss function, with c as a parameter (see loss_kernels.py)
 def huber_loss(x, c):
-    xcopy = np.copy(x)
-
-    for i in range(len(xcopy)):
-        if np.abs(xcopy[i]) <= c:
-            xcopy[i] = 0.5 * x[i] ** 2
-        elif np.abs(xcopy[i]) > c:
-            xcopy[i] = c * (np.abs(x[i]) - 0.5 * c)
-    
-    return xcopy
+    return huber_rho(x, c)
 
 
-#Tukey's loss, with c as a parameter
+#Tukey's loss, with c as a parameter (see loss_kernels.py)
 def tukey_loss(x, c):
-    x_copy = np.copy(x)
-    for i in range(len(x_copy)):
-        if np.abs(x_copy[i]) <= c:
-            x_copy[i] = (c ** 2 / 6) * (1 - (1 - (x[i] / c) ** 2) ** 3)
-        elif np.abs(x_copy[i]) > c:
-            x_copy[i] = c ** 2 / 6
-    
-    return x_copy
-
-
-x = np.linspace(-6, 6, 400)
-
-
-set_ylim = (0, 4)
+    return tukey_rho(x, c)
 
-# We plot all of the functions on the same graph, using multiple c parameters for Tukey's loss
-plt.figure(figsize=(10, 6))
-plt.plot(x, squared_loss(x), label='Squared Loss')
-plt.plot(x, absolute_loss(x), label='Absolute Loss')
-plt.plot(x, huber_loss(x, 1.5), label='Huber Loss (c=1.5)')
-plt.plot(x, tukey_loss(x, 2), label='Tukey Loss (c=2)')
-plt.plot(x, tukey_loss(x, 4), label='Tukey Loss (c=4)')
 
-plt.xlabel('r')
-plt.ylabel('Loss')
-plt.title('Comparison of Loss Functions')
-plt.legend()
-plt.ylim(set_ylim)
-plt.show()
+if __name__ == '__main__':
+    x = np.linspace(-6, 6, 400)
 
 
+    set_ylim = (0, 4)
 
+    # We plot all of the functions on the same graph, using multiple c parameters for Tukey's loss
+    plt.figure(figsize=(10, 6))
+    plt.plot(x, squared_loss(x), label='Squared Loss')
+    plt.plot(x, absolute_loss(x), label='Absolute Loss')
+    plt.plot(x, huber_loss(x, 1.5), label='Huber Loss (c=1.5)')
+    plt.plot(x, tukey_loss(x, 2), label='Tukey Loss (c=2)')
+    plt.plot(x, tukey_loss(x, 4), label='Tukey Loss (c=4)')
 
+    plt.xlabel('r')
+    plt.ylabel('Loss')
+    plt.title('Comparison of Loss Functions')
+    plt.legend()
+    plt.ylim(set_ylim)
+    plt.show()
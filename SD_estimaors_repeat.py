@@ -12,9 +12,10 @@ and each subsequent estimate is also calculated, and everything is returned in a
 
 
 
-from statistics import median, mean, stdev
+from statistics import mean, NormalDist
 import numpy as np
-import pandas as pd
+
+from order_stats import QuantileSummary
 
 
 ###############################################################
@@ -58,14 +59,7 @@ def abs_dev(data):
 
 # This function returns the unnormalised MAD of a data set
 def MAD(data):
-    n = len(data)
-    x_tilde = median(data)
-
-    dist_store = []
-    for i in range(n):
-        dist_store.append(abs(data[i]-x_tilde))
-    
-    unnorm_sd = median(dist_store)
+    unnorm_sd = QuantileSummary(data, probs=(0.5,)).mad()
 
     return unnorm_sd
 
@@ -95,274 +89,195 @@ def Winsorize_bad(data, c):
 
 
 
-# This function calculates the S_n estimator of scale for a data set
+# This function calculates the S_n estimator of scale for a data set.
+# After sorting, the distances from each point to the others are two sorted
+# runs (to the left and to the right of it), so the inner medians can all be
+# found together by a binary search over the rows (Croux and Rousseeuw,
+# 1992), in O(n log n) time and O(n) memory.
 def S_n(data):
-    n = len(data)
-    med_store = []
-    for i in range(0,n):
-        abs_store = []
-        for j in range(0,n):
-            abs_store.append(abs(data[i]-data[j]))
-        med_store.append(median(abs_store))
-    
-    return median(med_store)
-
-
-
-# This function calculates the Q_n estimator of scale for a data set, 
-# taking the parameter value k as an input
-def Q_n(data, k):
-    n = len(data)
-    abs_store = []
-
-    for i in range(n):
-        for j in range(i+1,n):
-            abs_store.append(abs(data[i]-data[j]))
-    n2 = len(abs_store)
-    abs_sorted = sorted(abs_store)
-    ind = int(n2//(1/k))
-    return (abs_sorted[ind])
-
-
-###############################################################
-############## Apply estimators to data sets ##################
-###############################################################
-
-# Lists to store all of our values
-emp1 = []
-abso1 = []
-mad1 = []
-win1 = []
-sn1 = []
-qn1 = []
-
-emp2 = []
-abso2 = []
-mad2 = []
-win2 = []
-sn2 = []
-qn2 = []
-
-emp3 = []
-abso3 = []
-mad3 = []
-win3 = []
-sn3 = []
-qn3 = []
+    y = np.sort(np.asarray(data, dtype=float))
+    n = len(y)
+    if n == 0:
+        raise ValueError('S_n needs at least one point')
 
-emp4 = []
-abso4 = []
-mad4 = []
-win4 = []
-sn4 = []
-qn4 = []
+    inner = (_kth_distance(y, (n - 1) // 2 + 1) + _kth_distance(y, n // 2 + 1)) / 2
 
+    return QuantileSummary(inner, probs=(0.5,)).median()
 
 
 
+# This function returns, for every point y[i] of the sorted data y, the k-th
+# smallest (1-based) of the distances |y[j] - y[i]| over all j (including
+# j = i). The k nearest points to y[i] form a block y[a], ..., y[a+k-1] which
+# contains i, and the best block is the first one whose right end is at least
+# as far from y[i] as its left end. That block start a is found by bisection
+# for all rows at once.
+def _kth_distance(y, k):
+    n = len(y)
+    rows = np.arange(n)
+    lo_start = np.maximum(rows - k + 1, 0)
+    hi_start = np.minimum(rows, n - k)
 
+    def left_dist(a):
+        return y - y[np.clip(a, 0, n - 1)]
 
-# Apply each estimator to each data set type 100 times
-for i in range(100):
-    # The original data is 200 points from a N(0,1)
-    data_use = np.random.normal(size = 200)
+    def right_dist(a):
+        return y[np.clip(a + k - 1, 0, n - 1)] - y
 
-    data = data_use
+    lo = lo_start.copy()
+    hi = hi_start + 1
+    while True:
+        searching = lo < hi
+        if not searching.any():
+            break
+        mid = (lo + hi) // 2
+        right_wins = left_dist(mid) <= right_dist(mid)
+        hi = np.where(searching & right_wins, mid, hi)
+        lo = np.where(searching & ~right_wins, mid + 1, lo)
 
-    # Apply our estimators to the data
-    emp1.append(empirical_SD(data))
-    abso1.append(abs_dev(data))
-    mad1.append(MAD(data))
-    win1.append(Winsorize_bad(data, 1.7))
-    sn1.append(S_n(data))
-    qn1.append(Q_n(data, 0.25))
+    # The answer is the far end of either block lo or block lo - 1
+    dist = np.where(lo <= hi_start, right_dist(lo), np.inf)
+    dist = np.minimum(dist, np.where(lo > lo_start, left_dist(lo - 1), np.inf))
 
+    return dist
 
-    # This data set has an additional value at 10,000, very low level but 
-    # extreme corruption
-    corruption = [10000]
-    data = np.concatenate((data_use, corruption))
 
-    emp2.append(empirical_SD(data))
-    abso2.append(abs_dev(data))
-    mad2.append(MAD(data))
-    win2.append(Winsorize_bad(data, 1.7))
-    sn2.append(S_n(data))
-    qn2.append(Q_n(data, 0.25))
 
-
-
-    # This data set has the original 200 N(0,1) points as well as 10 points
-    # from a N(0,9) distribution, a higher level but less extreme corruption
-    # type
-    corruption = np.random.normal(size = 10, scale = 9)
-    data = np.concatenate((data_use, corruption))
-
-    emp3.append(empirical_SD(data))
-    abso3.append(abs_dev(data))
-    mad3.append(MAD(data))
-    win3.append(Winsorize_bad(data, 1.7))
-    sn3.append(S_n(data))
-    qn3.append(Q_n(data, 0.25))
-
-
-    # The last data set has the original 200 N(0,1) points as well as 50 points
-    # set at 0. This is a high level of corruption, but of a different type
-    corruption = [0]*50
-    data = np.concatenate((data_use, corruption))
-
-    emp4.append(empirical_SD(data))
-    abso4.append(abs_dev(data))
-    mad4.append(MAD(data))
-    win4.append(Winsorize_bad(data, 1.7))
-    sn4.append(S_n(data))
-    qn4.append(Q_n(data, 0.25))
-
-
-
-###############################################################
-############# Calculate means and Stand. Dev. #################
-###############################################################
-
-# We calculate the means and samle SDs of each of the lists above, and store them in rows
-
-emp_m1 = round(mean(emp1),3)
-emp_sd1 = round(stdev(emp1),3)
-abso_m1 = round(mean(abso1),3)
-abso_sd1 = round(stdev(abso1),3)
-mad_m1 = round(mean(mad1),3)
-mad_sd1 = round(stdev(mad1),3)
-win_m1 = round(mean(win1),3)
-win_sd1 = round(stdev(win1),3)
-sn_m1 = round(mean(sn1),3)
-sn_sd1 = round(stdev(sn1),3)
-qn_m1 = round(mean(qn1),3)
-qn_sd1 = round(stdev(qn1),3)
-
-emp_msd1 = f'{emp_m1}, {emp_sd1}'
-abso_msd1 = f'{abso_m1}, {abso_sd1}'
-mad_msd1 = f'{mad_m1}, {mad_sd1}'
-win_msd1 = f'{win_m1}, {win_sd1}'
-sn_msd1 = f'{sn_m1}, {sn_sd1}'
-qn_msd1 = f'{qn_m1}, {qn_sd1}'
-
-row1 = (emp_msd1, abso_msd1, mad_msd1, win_msd1, sn_msd1, qn_msd1)
-
-
-
-
-emp_m2 = round(mean(emp2),3)
-emp_sd2 = round(stdev(emp2),3)
-abso_m2 = round(mean(abso2),3)
-abso_sd2 = round(stdev(abso2),3)
-mad_m2 = round(mean(mad2),3)
-mad_sd2 = round(stdev(mad2),3)
-win_m2 = round(mean(win2),3)
-win_sd2 = round(stdev(win2),3)
-sn_m2 = round(mean(sn2),3)
-sn_sd2 = round(stdev(sn2),3)
-qn_m2 = round(mean(qn2),3)
-qn_sd2 = round(stdev(qn2),3)
-
-emp_msd2 = f'{emp_m2}, {emp_sd2}'
-abso_msd2 = f'{abso_m2}, {abso_sd2}'
-mad_msd2 = f'{mad_m2}, {mad_sd2}'
-win_msd2 = f'{win_m2}, {win_sd2}'
-sn_msd2 = f'{sn_m2}, {sn_sd2}'
-qn_msd2 = f'{qn_m2}, {qn_sd2}'
-
-row2 = (emp_msd2, abso_msd2, mad_msd2, win_msd2, sn_msd2, qn_msd2)
-
-
-emp_m3 = round(mean(emp3),3)
-emp_sd3 = round(stdev(emp3),3)
-abso_m3 = round(mean(abso3),3)
-abso_sd3 = round(stdev(abso3),3)
-mad_m3 = round(mean(mad3),3)
-mad_sd3 = round(stdev(mad3),3)
-win_m3 = round(mean(win3),3)
-win_sd3 = round(stdev(win3),3)
-sn_m3 = round(mean(sn3),3)
-sn_sd3 = round(stdev(sn3),3)
-qn_m3 = round(mean(qn3),3)
-qn_sd3 = round(stdev(qn3),3)
-
-emp_msd3 = f'{emp_m3}, {emp_sd3}'
-abso_msd3 = f'{abso_m3}, {abso_sd3}'
-mad_msd3 = f'{mad_m3}, {mad_sd3}'
-win_msd3 = f'{win_m3}, {win_sd3}'
-sn_msd3 = f'{sn_m3}, {sn_sd3}'
-qn_msd3 = f'{qn_m3}, {qn_sd3}'
-
-row3 = (emp_msd3, abso_msd3, mad_msd3, win_msd3, sn_msd3, qn_msd3)
-
-
-emp_m4 = round(mean(emp4),3)
-emp_sd4 = round(stdev(emp4),3)
-abso_m4 = round(mean(abso4),3)
-abso_sd4 = round(stdev(abso4),3)
-mad_m4 = round(mean(mad4),3)
-mad_sd4 = round(stdev(mad4),3)
-win_m4 = round(mean(win4),3)
-win_sd4 = round(stdev(win4),3)
-sn_m4 = round(mean(sn4),3)
-sn_sd4 = round(stdev(sn4),3)
-qn_m4 = round(mean(qn4),3)
-qn_sd4 = round(stdev(qn4),3)
-
-emp_msd4 = f'{emp_m4}, {emp_sd4}'
-abso_msd4 = f'{abso_m4}, {abso_sd4}'
-mad_msd4 = f'{mad_m4}, {mad_sd4}'
-win_msd4 = f'{win_m4}, {win_sd4}'
-sn_msd4 = f'{sn_m4}, {sn_sd4}'
-qn_msd4 = f'{qn_m4}, {qn_sd4}'
-
-row4 = (emp_msd4, abso_msd4, mad_msd4, win_msd4, sn_msd4, qn_msd4)
-
-
-row2_5 = []
-
-row3_5 = []
-
-row4_5 = []
+# This function calculates the Q_n estimator of scale for a data set, 
+# taking the parameter value k as an input. The order statistic of the
+# pairwise distances is found with the selection algorithm of Croux and
+# Rousseeuw (1992) instead of building and sorting all n(n-1)/2 distances,
+# so it needs O(n) memory and O(n log n) time per pass over O(log n) passes.
+# If consistent is True the result is multiplied by the factor which makes
+# Q_n a consistent estimator of the standard deviation for normal data.
+def Q_n(data, k, consistent=False):
+    y = np.sort(np.asarray(data, dtype=float))
+    n = len(y)
+    n2 = n * (n - 1) // 2
+    ind = int(n2//(1/k))
+    if not 0 <= ind < n2:
+        raise ValueError(f'Q_n needs 0 <= k < 1 and at least two points, got k={k} and n={n}')
+
+    qn = _select_pairwise_distance(y, ind)
+
+    if consistent:
+        qn = qn / (np.sqrt(2) * NormalDist().inv_cdf((1 + k) / 2))
+
+    return qn
+
+
+# Row i of the (implicit) distance matrix of the sorted data y holds
+# y[j] - y[i] for j > i, which is increasing in j. This function returns,
+# for every row, the first column whose distance is not below trial, and the
+# first whose distance is above it. Tied values give equal distances, so the
+# boundaries always fall at the start of a run of ties, and they are found
+# among the distinct values (values, with the runs starting at starts): a
+# searchsorted on y + trial gives the first boundary up to rounding, and each
+# boundary is then moved while the exactly computed distance disagrees. Only
+# distinct values within rounding of y + trial can disagree, so this takes a
+# step or two however many ties there are.
+def _row_boundaries(y, values, starts, trial):
+    n = len(y)
+    m = len(values)
+
+    def distance(b):
+        return values[np.minimum(b, m - 1)] - y
+
+    def advance(pos, inside):
+        while True:
+            move = (pos < m) & inside(distance(pos))
+            if not move.any():
+                return pos
+            pos[move] += 1
+
+    less = np.searchsorted(values, y + trial, side='left')
+    while True:
+        move = (less > 0) & (distance(less - 1) >= trial)
+        if not move.any():
+            break
+        less[move] -= 1
+    less = advance(less, lambda d: d < trial)
+    less_equal = advance(less.copy(), lambda d: d <= trial)
+
+    ends = np.append(starts, n)
+    first = np.arange(n) + 1
+    return np.maximum(ends[less], first), np.maximum(ends[less_equal], first)
+
+
+# This function returns the high weighted median of values, the smallest
+# value v for which the values up to v carry more than half the weight. It is
+# found by quickselect: the values are split around the median value, and the
+# search carries on in the side holding the answer, in O(n) time overall.
+def _weighted_high_median(values, weights):
+    total = weights.sum()
+    below = 0
+    while True:
+        pivot = np.partition(values, len(values) // 2)[len(values) // 2]
+        lower = values < pivot
+        upper = values > pivot
+        w_lower = below + weights[lower].sum()
+        w_upper = w_lower + weights[~(lower | upper)].sum()
+        if 2 * w_lower > total:
+            values, weights = values[lower], weights[lower]
+        elif 2 * w_upper > total:
+            return pivot
+        else:
+            below = w_upper
+            values, weights = values[upper], weights[upper]
+
+
+# This function returns the distance of (0-based) rank ind among the pairwise
+# distances y[j] - y[i], i < j, of the sorted data y. Each row keeps a window
+# [left, right] of candidate columns; the weighted median of the window
+# midpoints is used as a trial value, and every row is cut down to the side
+# of the trial value on which the answer lies. Once at most n candidates are
+# left they are gathered and the answer is found with np.partition.
+def _select_pairwise_distance(y, ind):
+    n = len(y)
+    rows = np.arange(n)
+    left = rows + 1
+    right = np.full(n, n - 1)
+    values, starts = np.unique(y, return_index=True)
+
+    while True:
+        width = np.maximum(right - left + 1, 0)
+        if width.sum() <= n:
+            break
+
+        active = width > 0
+        mid = (left[active] + right[active]) // 2
+        trial = _weighted_high_median(y[mid] - y[rows[active]], width[active])
+
+        less, less_equal = _row_boundaries(y, values, starts, trial)
+        n_less = less - rows - 1
+        n_less_equal = less_equal - rows - 1
+
+        if ind < n_less.sum():
+            right = np.minimum(right, rows + n_less)
+        elif ind >= n_less_equal.sum():
+            left = np.maximum(left, rows + n_less_equal + 1)
+        else:
+            return trial
+
+    # Gather the remaining candidates, and count the distances below them
+    n_below = (left - rows - 1).sum()
+    row_of = np.repeat(rows, width)
+    starts = np.cumsum(width) - width
+    cols = np.arange(width.sum()) - np.repeat(starts, width) + np.repeat(left, width)
+    candidates = y[cols] - y[row_of]
+
+    return np.partition(candidates, ind - n_below)[ind - n_below]
 
 
 ###############################################################
-################# Calculate perc. changes #####################
+############## Apply estimators to data sets ##################
 ###############################################################
 
-# We calculate the percentage change in the means of each estimator between the first
-# and each subsequent data set 
-
-
-row2_5.append(100*(abs(emp_m2-emp_m1))/emp_m1)
-row2_5.append(100*(abs(abso_m2-abso_m1))/abso_m1)
-row2_5.append(100*(abs(mad_m2-mad_m1))/mad_m1)
-row2_5.append(100*(abs(win_m2-win_m1))/win_m1)
-row2_5.append(100*(abs(sn_m2-sn_m1))/sn_m1)
-row2_5.append(100*(abs(qn_m2-qn_m1))/qn_m1)
-
-
-row3_5.append(100*(abs(emp_m3-emp_m1))/emp_m1)
-row3_5.append(100*(abs(abso_m3-abso_m1))/abso_m1)
-row3_5.append(100*(abs(mad_m3-mad_m1))/mad_m1)
-row3_5.append(100*(abs(win_m3-win_m1))/win_m1)
-row3_5.append(100*(abs(sn_m3-sn_m1))/sn_m1)
-row3_5.append(100*(abs(qn_m3-qn_m1))/qn_m1)
-
-
-row4_5.append(100*(abs(emp_m4-emp_m1))/emp_m1)
-row4_5.append(100*(abs(abso_m4-abso_m1))/abso_m1)
-row4_5.append(100*(abs(mad_m4-mad_m1))/mad_m1)
-row4_5.append(100*(abs(win_m4-win_m1))/win_m1)
-row4_5.append(100*(abs(sn_m4-sn_m1))/sn_m1)
-row4_5.append(100*(abs(qn_m4-qn_m1))/qn_m1)
-
-
+# The replications, summary and percentage changes are run by scale_study.py,
+# which spreads the replications over a process pool
+if __name__ == '__main__':
+    from scale_study import run_study
 
-# Return all of the results
-d = {'Data A': row1, 'Data B': row2, '% diff A B': row2_5, 'Data C': row3, '% diff A C ': row3_5, 'Data D': row4, '% diff A, D': row4_5}
-df = pd.DataFrame(data=d)
-df.index = ['Sample standard deviation','Absolute deviation','MAD','Winsor shift','S_n','Q_n']
+    df = run_study(n_reps=100)
 
-print(df.to_string())
\ No newline at end of file
+    print(df.to_string())
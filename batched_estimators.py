@@ -0,0 +1,412 @@
+'''
+BATCHED SCALE ESTIMATORS
+
+Batched versions of the scale estimators in SD_estimaors_repeat.py. Rather than one 1-D
+sample at a time, each function takes either a 2-D array, where every row is a sample, or
+a ragged collection given as one flat array of values plus offsets (sample i is
+values[offsets[i]:offsets[i+1]]), and returns one estimate per sample. All the work is done
+with axis-wise NumPy reductions, np.partition (2-D input) or one segmented sort (ragged
+input), so there is no Python-level loop over the data.
+
+S_n and Q_n run the same algorithms as SD_estimaors_repeat.py on every point of every sample
+at once: all the samples are sorted in one flat array, and each bisection or selection step
+works on all of them together, so a batch of B short samples costs a few dozen NumPy calls
+rather than B Python calls of S_n or Q_n. Samples longer than _FLAT_LENGTH are already long
+enough to keep NumPy busy on their own, and the single-sample functions are faster for them
+(about 4 ms for S_n and 17 ms for Q_n at n = 10,000), so those are still done one at a time.
+
+'''
+
+
+import numpy as np
+
+from statistics import NormalDist
+
+from SD_estimaors_repeat import S_n, Q_n
+
+
+# The length above which S_n and Q_n are applied to one sample at a time
+_FLAT_LENGTH = 500
+
+
+###############################################################
+##################### Helper functions ########################
+###############################################################
+
+# This function turns a list of (possibly different length) samples into the
+# flat values array and offsets used by the ragged form of the estimators
+def stack_ragged(samples):
+    samples = [np.asarray(s, dtype=float).ravel() for s in samples]
+    lengths = np.array([len(s) for s in samples], dtype=np.intp)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    values = np.concatenate(samples) if samples else np.empty(0)
+    return values, offsets
+
+
+# This function checks the input and returns it as a float array, along with
+# the offsets (None for 2-D input) and the length of each sample
+def prepare_samples(data, offsets):
+    data = np.asarray(data, dtype=float)
+    if offsets is None:
+        if data.ndim != 2:
+            raise ValueError(f'expected a 2-D array of samples, got {data.ndim} dimensions')
+        if data.shape[1] == 0:
+            raise ValueError('samples must not be empty')
+        lengths = np.full(data.shape[0], data.shape[1])
+    else:
+        offsets = np.asarray(offsets, dtype=np.intp)
+        if data.ndim != 1 or offsets[0] != 0 or offsets[-1] != len(data):
+            raise ValueError('ragged input needs a 1-D values array and offsets from 0 to len(values)')
+        lengths = np.diff(offsets)
+        if np.any(lengths <= 0):
+            raise ValueError('samples must not be empty')
+    return data, offsets, lengths
+
+
+# This function returns the sum of each sample
+def sample_sums(data, offsets):
+    if offsets is None:
+        return data.sum(axis=1)
+    return np.add.reduceat(data, offsets[:-1])
+
+
+# This function returns the minimum of each sample
+def sample_mins(data, offsets):
+    if offsets is None:
+        return data.min(axis=1)
+    return np.minimum.reduceat(data, offsets[:-1])
+
+
+# This function repeats one value per sample out to the shape of the data,
+# so that it can be combined elementwise with the data
+def expand_samples(per_sample, offsets, lengths):
+    if offsets is None:
+        return per_sample[:, None]
+    return np.repeat(per_sample, lengths)
+
+
+# This function returns the q-quantile of each sample, interpolating linearly
+# between order statistics as np.percentile does
+def _quantile(data, offsets, lengths, q):
+    if offsets is None:
+        return np.percentile(data, 100 * q, axis=1)
+
+    segment = np.repeat(np.arange(len(lengths)), lengths)
+    ordered = data[np.lexsort((data, segment))]
+    pos = q * (lengths - 1)
+    lo = np.floor(pos).astype(np.intp)
+    hi = np.minimum(lo + 1, lengths - 1)
+    a = ordered[offsets[:-1] + lo]
+    b = ordered[offsets[:-1] + hi]
+    t = pos - lo
+    return np.where(t >= 0.5, b - (b - a) * (1 - t), a + (b - a) * t)
+
+
+# This function returns the median of each sample, averaging the two middle
+# values when the sample length is even (as statistics.median does)
+def sample_medians(data, offsets, lengths):
+    lo = (lengths - 1) // 2
+    hi = lengths // 2
+    if offsets is None:
+        n = data.shape[1]
+        part = np.partition(data, [(n - 1) // 2, n // 2], axis=1)
+        return (part[:, lo[0]] + part[:, hi[0]]) / 2
+
+    # Sort each sample in place within the flat array, then read the
+    # middle values off at the offsets
+    segment = np.repeat(np.arange(len(lengths)), lengths)
+    ordered = data[np.lexsort((data, segment))]
+    starts = offsets[:-1]
+    return (ordered[starts + lo] + ordered[starts + hi]) / 2
+
+
+# This function returns the data of the samples for which keep is True
+def select_samples(data, offsets, lengths, keep):
+    if offsets is None:
+        return data[keep], None, lengths[keep]
+    lengths = lengths[keep]
+    return data[np.repeat(keep, np.diff(offsets))], np.concatenate(([0], np.cumsum(lengths))), lengths
+
+
+# This function applies flat (the all-samples-at-once form of an estimator) to
+# the samples of length up to _FLAT_LENGTH, and single to the others one at a
+# time
+def _by_length(data, offsets, lengths, flat, single):
+    result = np.empty(len(lengths))
+    short = lengths <= _FLAT_LENGTH
+    if short.any():
+        result[short] = flat(*select_samples(data, offsets, lengths, short))
+    for i in np.flatnonzero(~short):
+        result[i] = single(data[i] if offsets is None else data[offsets[i]:offsets[i + 1]])
+    return result
+
+
+# This function sorts every sample, returning the sorted values as one flat
+# array along with the offsets of the samples in it and, for every value, its
+# sample, the start of its sample and its position within the sample
+def _sorted_flat(data, offsets, lengths):
+    if offsets is None:
+        y = np.sort(data, axis=1).ravel()
+        offsets = np.arange(len(lengths) + 1) * data.shape[1]
+    else:
+        segment = np.repeat(np.arange(len(lengths)), lengths)
+        y = data[np.lexsort((data, segment))]
+    segment = np.repeat(np.arange(len(lengths)), lengths)
+    start = offsets[:-1][segment]
+    return y, offsets, segment, start, np.arange(len(y)) - start
+
+
+# This function returns, for every value y[start + i] of the sorted samples,
+# the k-th smallest (1-based) of its distances to the values of its sample,
+# with k and the sample length n given per value. As in _kth_distance in
+# SD_estimaors_repeat.py, the k nearest values form a block which is found by
+# bisection, here for every value of every sample at once.
+def _kth_distance(y, start, i, n, k):
+    lo_start = np.maximum(i - k + 1, 0)
+    hi_start = np.minimum(i, n - k)
+
+    def left_dist(a):
+        return y - y[start + np.clip(a, 0, n - 1)]
+
+    def right_dist(a):
+        return y[start + np.clip(a + k - 1, 0, n - 1)] - y
+
+    lo = lo_start.copy()
+    hi = hi_start + 1
+    while True:
+        searching = lo < hi
+        if not searching.any():
+            break
+        mid = (lo + hi) // 2
+        right_wins = left_dist(mid) <= right_dist(mid)
+        hi = np.where(searching & right_wins, mid, hi)
+        lo = np.where(searching & ~right_wins, mid + 1, lo)
+
+    dist = np.where(lo <= hi_start, right_dist(lo), np.inf)
+    return np.minimum(dist, np.where(lo > lo_start, left_dist(lo - 1), np.inf))
+
+
+# This function returns a copy of the sorted samples y laid end to end on one
+# increasing scale: each sample is shifted to start at its sample's place,
+# with gaps wider than twice its range between samples, so that a value plus
+# any distance within its sample stays inside the sample's stretch
+def _stacked(y, offsets, segment):
+    low = y[offsets[:-1]]
+    span = 2 * (y[offsets[1:] - 1] - low) + 1
+    base = np.concatenate(([0], np.cumsum(span)[:-1]))
+    return y - low[segment] + base[segment]
+
+
+# This function returns the high weighted median of the values of each
+# segment (segments numbered 0 to n_segments - 1, which need not all appear).
+# The values are sorted by segment and value at once on a float key, which
+# may order values within rounding of each other either way, so the result is
+# always one of the values and within rounding of the weighted median.
+def _segment_weighted_high_median(values, weights, segment, n_segments):
+    span = np.zeros(n_segments)
+    np.maximum.at(span, segment, values)
+    base = np.concatenate(([0], np.cumsum(2 * span + 1)[:-1]))
+    order = np.argsort(values + base[segment])
+    values, weights, segment = values[order], weights[order], segment[order]
+
+    cum = np.cumsum(weights)
+    total = np.bincount(segment, weights=weights, minlength=n_segments)
+    before = np.concatenate(([0], np.cumsum(total)))[segment]
+    past_half = np.flatnonzero(2 * (cum - before) > total[segment])
+    first_segment, first = np.unique(segment[past_half], return_index=True)
+    result = np.full(n_segments, np.nan)
+    result[first_segment] = values[past_half[first]]
+    return result
+
+
+# This function returns, for the rows r (flat positions) of the sorted
+# samples, the first column whose distance y[j] - y[r] is not below trial,
+# and the first whose distance is above it, as flat positions. As in
+# _row_boundaries in SD_estimaors_repeat.py, the boundaries are searched
+# among runs of tied values (run_first holds the first position of each run,
+# and run_of the run of every position), starting from a searchsorted on the
+# stacked scale z, and moved while the exactly computed distance disagrees.
+def _flat_row_boundaries(y, z, run_first, run_of, run_end, rows, trial):
+    run_y = y[run_first]
+    row_y = y[rows]
+    low = run_of[rows]
+    high = run_end[rows]
+
+    def distance(b):
+        return run_y[np.minimum(b, len(run_y) - 1)] - row_y
+
+    def advance(pos, inside):
+        while True:
+            move = (pos < high) & inside(distance(pos))
+            if not move.any():
+                return pos
+            pos[move] += 1
+
+    less = np.clip(np.searchsorted(z[run_first], z[rows] + trial, side='left'), low, high)
+    while True:
+        move = (less > low) & (distance(less - 1) >= trial)
+        if not move.any():
+            break
+        less[move] -= 1
+    less = advance(less, lambda d: d < trial)
+    less_equal = advance(less.copy(), lambda d: d <= trial)
+
+    ends = np.append(run_first, len(y))
+    return np.maximum(ends[less], rows + 1), np.maximum(ends[less_equal], rows + 1)
+
+
+###############################################################
+#################### Batched estimators #######################
+###############################################################
+
+# This function returns the sample standard deviation of each sample
+def batched_empirical_SD(data, offsets=None):
+    data, offsets, lengths = prepare_samples(data, offsets)
+    mu = sample_sums(data, offsets) / lengths
+    sum_sq = sample_sums((data - expand_samples(mu, offsets, lengths)) ** 2, offsets)
+    return np.sqrt(sum_sq / (lengths - 1))
+
+
+# This function returns the normalised absolute deviation of each sample
+def batched_abs_dev(data, offsets=None):
+    data, offsets, lengths = prepare_samples(data, offsets)
+    mu = sample_sums(data, offsets) / lengths
+    sum_abs = sample_sums(np.abs(data - expand_samples(mu, offsets, lengths)), offsets)
+    return np.sqrt(np.pi / 2) / (lengths - 1) * sum_abs
+
+
+# This function returns the unnormalised MAD of each sample
+def batched_MAD(data, offsets=None):
+    data, offsets, lengths = prepare_samples(data, offsets)
+    x_tilde = sample_medians(data, offsets, lengths)
+    dist = np.abs(data - expand_samples(x_tilde, offsets, lengths))
+    return sample_medians(dist, offsets, lengths)
+
+
+# This function Winsorizes each sample at its mean plus or minus c sample SDs,
+# and returns the sample SD of the Winsorized samples. Unlike Winsorize_bad,
+# the input data is left unchanged.
+def batched_Winsorize_bad(data, c, offsets=None):
+    data, offsets, lengths = prepare_samples(data, offsets)
+    mu = sample_sums(data, offsets) / lengths
+    sigma = batched_empirical_SD(data, offsets)
+
+    upper_bound = expand_samples(mu + c * sigma, offsets, lengths)
+    lower_bound = expand_samples(mu - c * sigma, offsets, lengths)
+
+    clipped = np.clip(data, lower_bound, upper_bound)
+
+    return batched_empirical_SD(clipped, offsets)
+
+
+# This function returns the S_n estimate of each sample, with all the samples
+# done together
+def _flat_S_n(data, offsets, lengths):
+    y, offsets, segment, start, i = _sorted_flat(data, offsets, lengths)
+    n = lengths[segment]
+
+    inner = (_kth_distance(y, start, i, n, (n - 1) // 2 + 1) + _kth_distance(y, start, i, n, n // 2 + 1)) / 2
+    return sample_medians(inner, offsets, lengths)
+
+
+# This function returns the Q_n estimate of each sample, for the parameter k,
+# with all the samples done together. The selection of Q_n in SD_estimaors_repeat.py is run on every sample at
+# once: each row of each sample keeps a window [left, right] of candidate
+# columns (flat positions), every sample still searching gets its own trial
+# value (the weighted median of its window midpoints), and the row boundaries
+# of all the samples are found with one searchsorted on the stacked scale.
+# Samples are finished as their trial value hits their rank, or once at most
+# n candidates are left, which are then sorted together.
+def _flat_Q_n(data, offsets, lengths, k):
+    n_pairs = lengths * (lengths - 1) // 2
+    ind = (n_pairs // (1 / k)).astype(np.int64)
+    if np.any(ind < 0) or np.any(ind >= n_pairs):
+        raise ValueError(f'Q_n needs 0 <= k < 1 and at least two points per sample, got k={k}')
+
+    y, offsets, segment, start, _ = _sorted_flat(data, offsets, lengths)
+    z = _stacked(y, offsets, segment)
+    new_run = np.ones(len(y), dtype=bool)
+    new_run[1:] = (y[1:] != y[:-1]) | (segment[1:] != segment[:-1])
+    run_first = np.flatnonzero(new_run)
+    run_of = np.cumsum(new_run) - 1
+    run_end = (run_of[offsets[1:] - 1] + 1)[segment]
+
+    n_samples = len(lengths)
+    positions = np.arange(len(y))
+    left = positions + 1
+    right = (offsets[1:] - 1)[segment]
+    qn = np.full(n_samples, np.nan)
+    done = np.zeros(n_samples, dtype=bool)
+
+    while True:
+        width = np.maximum(right - left + 1, 0)
+        searching = ~done & (np.bincount(segment, weights=width, minlength=n_samples) > lengths)
+        if not searching.any():
+            break
+
+        rows = np.flatnonzero(searching[segment])
+        active = rows[width[rows] > 0]
+        mid = (left[active] + right[active]) // 2
+        trial = _segment_weighted_high_median(y[mid] - y[active], width[active], segment[active], n_samples)
+
+        less, less_equal = _flat_row_boundaries(y, z, run_first, run_of, run_end, rows, trial[segment[rows]])
+        n_less = np.bincount(segment[rows], weights=less - rows - 1, minlength=n_samples)
+        n_less_equal = np.bincount(segment[rows], weights=less_equal - rows - 1, minlength=n_samples)
+
+        below = searching & (ind < n_less)
+        above = searching & (ind >= n_less_equal)
+        hit = searching & ~below & ~above
+        qn[hit] = trial[hit]
+        done |= hit
+
+        cut = below[segment[rows]]
+        right[rows[cut]] = np.minimum(right[rows[cut]], less[cut] - 1)
+        cut = above[segment[rows]]
+        left[rows[cut]] = np.maximum(left[rows[cut]], less_equal[cut])
+
+    # Gather the remaining candidates of the unfinished samples, and pick the
+    # right one from each after sorting them by sample and distance
+    width = np.where(done[segment], 0, np.maximum(right - left + 1, 0))
+    row_of = np.repeat(positions, width)
+    cols = np.arange(width.sum()) - np.repeat(np.cumsum(width) - width, width) + np.repeat(left, width)
+    candidates = y[cols] - y[row_of]
+    candidate_segment = segment[row_of]
+    ordered = candidates[np.lexsort((candidates, candidate_segment))]
+
+    rest = np.flatnonzero(~done)
+    n_below = np.bincount(segment, weights=left - positions - 1, minlength=n_samples).astype(np.int64)
+    first = np.concatenate(([0], np.cumsum(np.bincount(candidate_segment, minlength=n_samples))))
+    qn[rest] = ordered[first[rest] + ind[rest] - n_below[rest]]
+
+    return qn
+
+
+# This function returns the S_n estimate of each sample
+def batched_S_n(data, offsets=None):
+    data, offsets, lengths = prepare_samples(data, offsets)
+    return _by_length(data, offsets, lengths, _flat_S_n, S_n)
+
+
+# This function returns the Q_n estimate of each sample, for the parameter k
+def batched_Q_n(data, k, offsets=None, consistent=False):
+    data, offsets, lengths = prepare_samples(data, offsets)
+    qn = _by_length(data, offsets, lengths, lambda *sub: _flat_Q_n(*sub, k), lambda sample: Q_n(sample, k))
+
+    if consistent:
+        qn = qn / (np.sqrt(2) * NormalDist().inv_cdf((1 + k) / 2))
+
+    return qn
+
+
+# This function Winsorizes each sample at its median plus or minus scale times
+# its IQR (as winsorize in weather_simulation.py), and returns the mean of the
+# Winsorized samples
+def batched_winsorized_mean(data, scale, offsets=None):
+    data, offsets, lengths = prepare_samples(data, offsets)
+    median = sample_medians(data, offsets, lengths)
+    iqr = _quantile(data, offsets, lengths, 0.75) - _quantile(data, offsets, lengths, 0.25)
+
+    upper_bound = expand_samples(median + scale * iqr, offsets, lengths)
+    lower_bound = expand_samples(median - scale * iqr, offsets, lengths)
+
+    return sample_sums(np.clip(data, lower_bound, upper_bound), offsets) / lengths
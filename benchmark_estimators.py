@@ -0,0 +1,196 @@
+'''
+BENCHMARKS
+
+In this code we time the estimator kernels of the project over a grid of sample sizes n
+(and dimensions p, for the MCD study): every scale estimator in SD_estimaors_repeat.py (Q_n
+also on rounded, heavily tied data like the weather readings), the loss functions in
+Loss_funcs.py, both winsorize functions (Winsorization_demo_graphs.py and
+weather_simulation.py) and one step of run_simulation from the MCD study. For each case
+the best wall-clock time over a few repeats and the peak memory allocated (measured with
+tracemalloc, in a separate run) are recorded.
+
+Results are saved as JSON, and can be compared against a stored baseline run, reporting
+every case which got slower (or used more memory) by more than a tolerance. Sub-millisecond
+timings jitter by far more than any sensible tolerance, so a slowdown only counts if it is
+also bigger than an absolute floor and than the spread of the repeats in both runs:
+
+    python benchmark_estimators.py --output baseline.json
+    python benchmark_estimators.py --compare baseline.json
+
+'''
+
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+###############################################################
+###################### Benchmark cases ########################
+###############################################################
+
+# This function returns the benchmark cases. Each case has a name, the function
+# to time, a function making fresh arguments for it from (n, p, rng), the
+# largest n to run it at by default (the pure Python estimators are O(n) with a
+# large constant or worse), and whether it depends on p.
+def benchmark_cases():
+    import SD_estimaors_repeat as sd
+    import Loss_funcs as lf
+    import Winsorization_demo_graphs as demo
+    import weather_simulation as weather
+
+    def sample(n, p, rng):
+        return (rng.normal(size=n),)
+
+    cases = [
+        ('empirical_SD', sd.empirical_SD, sample, 10 ** 5),
+        ('abs_dev', sd.abs_dev, sample, 10 ** 5),
+        ('MAD', sd.MAD, sample, 10 ** 5),
+        ('Winsorize_bad', sd.Winsorize_bad, lambda n, p, rng: (rng.normal(size=n), 1.7), 10 ** 5),
+        ('S_n', sd.S_n, sample, 10 ** 6),
+        ('Q_n', sd.Q_n, lambda n, p, rng: (rng.normal(size=n), 0.25), 10 ** 6),
+        ('Q_n (tied)', sd.Q_n, lambda n, p, rng: (np.round(rng.normal(10, 5, size=n), 1), 0.25), 10 ** 6),
+        ('squared_loss', lf.squared_loss, sample, 10 ** 6),
+        ('absolute_loss', lf.absolute_loss, sample, 10 ** 6),
+        ('huber_loss', lf.huber_loss, lambda n, p, rng: (rng.normal(size=n), 1.5), 10 ** 6),
+        ('tukey_loss', lf.tukey_loss, lambda n, p, rng: (rng.normal(size=n), 2), 10 ** 6),
+        ('winsorize (demo)', demo.winsorize, sample, 10 ** 6),
+        ('winsorize (weather)', weather.winsorize, lambda n, p, rng: (rng.normal(size=n), 1.7), 10 ** 6),
+    ]
+    cases = [{'name': name, 'func': func, 'args': args, 'max_n': max_n, 'uses_p': False}
+             for name, func, args, max_n in cases]
+
+    # The MCD study needs scikit-learn, so it is skipped if that is missing
+    try:
+        from mcd_simulation import run_simulation
+    except ImportError as e:
+        print(f'Skipping run_simulation: {e}', file=sys.stderr)
+    else:
+        cases.append({
+            'name': 'run_simulation',
+            'func': lambda n, p: run_simulation(p_values=[p], n=n, contamination_levels=[0.1],
+                                                n_sims=1, seed=0),
+            'args': lambda n, p, rng: (n, p),
+            'max_n': 10 ** 5,
+            'uses_p': True,
+        })
+
+    return cases
+
+
+###############################################################
+#################### Running and timing #######################
+###############################################################
+
+# This function returns the best time over the repeats, the spread of the
+# times (slowest minus best), and the peak memory allocated by one call, for a
+# case at (n, p)
+def measure(case, n, p, repeat=3, seed=0):
+    rng = np.random.default_rng(seed)
+
+    times = []
+    for _ in range(repeat):
+        args = case['args'](n, p, rng)
+        start = time.perf_counter()
+        case['func'](*args)
+        times.append(time.perf_counter() - start)
+
+    args = case['args'](n, p, rng)
+    tracemalloc.start()
+    try:
+        case['func'](*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return min(times), max(times) - min(times), peak
+
+
+# This function runs every case (whose name is in names, if given) over the
+# grid of sizes and dimensions, and returns the results as a dict
+def run_benchmarks(sizes, dims, repeat=3, names=None, all_sizes=False):
+    results = []
+    for case in benchmark_cases():
+        if names is not None and case['name'] not in names:
+            continue
+        for n in sizes:
+            if n > case['max_n'] and not all_sizes:
+                continue
+            for p in (dims if case['uses_p'] else [None]):
+                seconds, spread, peak = measure(case, n, p, repeat)
+                results.append({'case': case['name'], 'n': n, 'p': p,
+                                'seconds': seconds, 'spread': spread, 'peak_bytes': peak})
+                print(f"{case['name']:<22} n={n:<8} p={str(p):<4} {seconds:10.4f} s "
+                      f"{peak / 2 ** 20:10.2f} MiB", flush=True)
+
+    return {
+        'meta': {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.platform(),
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+# This function compares a run against a baseline run, returning a list of the
+# (case, n, p, measure, baseline, current) where the current run is more than
+# tolerance (as a fraction) worse than the baseline. The increase must also be
+# above a noise floor: min_seconds or min_bytes, and for times the spread of
+# the repeats of the two runs added together (zero for runs saved without it).
+def compare(current, baseline, tolerance=0.25, min_seconds=1e-3, min_bytes=2 ** 16):
+    base = {(r['case'], r['n'], r['p']): r for r in baseline['results']}
+    regressions = []
+    for r in current['results']:
+        b = base.get((r['case'], r['n'], r['p']))
+        if b is None:
+            continue
+        floors = {
+            'seconds': max(min_seconds, r.get('spread', 0.0) + b.get('spread', 0.0)),
+            'peak_bytes': min_bytes,
+        }
+        for measure_name, floor in floors.items():
+            increase = r[measure_name] - b[measure_name]
+            if increase > tolerance * b[measure_name] and increase > floor:
+                regressions.append((r['case'], r['n'], r['p'], measure_name, b[measure_name], r[measure_name]))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the estimator kernels.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6])
+    parser.add_argument('--dims', type=int, nargs='+', default=[2, 5, 10])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cases', nargs='+', help='only run the cases with these names')
+    parser.add_argument('--all-sizes', action='store_true', help="ignore each case's largest n")
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='compare the results against this baseline JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-seconds', type=float, default=1e-3,
+                        help='ignore slowdowns smaller than this many seconds')
+    parser.add_argument('--min-bytes', type=int, default=2 ** 16,
+                        help='ignore memory increases smaller than this many bytes')
+    args = parser.parse_args()
+
+    run = run_benchmarks(args.sizes, args.dims, args.repeat, args.cases, args.all_sizes)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(run, json.load(f), args.tolerance, args.min_seconds, args.min_bytes)
+        for case, n, p, measure_name, before, after in regressions:
+            print(f'REGRESSION {case} n={n} p={p} {measure_name}: {before:.4g} -> {after:.4g}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions')
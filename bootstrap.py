@@ -0,0 +1,155 @@
+'''
+BOOTSTRAP CONFIDENCE INTERVALS
+
+In this code we compute bootstrap confidence intervals for the robust estimators. The B
+resamples are drawn as a matrix of indices into the data, and each chunk of rows of that
+matrix is fed through one of the batched estimators in batched_estimators.py, so only one
+chunk of resamples is held in memory at a time. The chunks are spread over a thread or
+process pool, and every chunk has its own random stream spawned from one SeedSequence, so
+the result does not depend on the number of workers. Percentile and BCa intervals are
+supported.
+
+Most of the batched estimators spend their time inside NumPy, which releases the GIL, so
+threads are the default. The exception is S_n and Q_n on samples longer than a few hundred
+points, which batched_estimators.py applies one sample at a time: each resample then costs
+about 4 ms (S_n) or 17 ms (Q_n) at n = 10,000, mostly in small GIL-holding NumPy calls, so
+B = 10,000 replicates of Q_n take about three CPU minutes, and executor='process' is the one
+which spreads that over the cores.
+
+'''
+
+
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from statistics import NormalDist
+
+import numpy as np
+
+from batched_estimators import (batched_empirical_SD, batched_abs_dev, batched_MAD,
+                                batched_Winsorize_bad, batched_S_n, batched_Q_n,
+                                batched_winsorized_mean)
+
+
+# The estimators which can be given by name, with the parameters used in the
+# report
+ESTIMATORS = {
+    'SD': batched_empirical_SD,
+    'abs_dev': batched_abs_dev,
+    'MAD': batched_MAD,
+    'Winsorize_bad': partial(batched_Winsorize_bad, c=1.7),
+    'S_n': batched_S_n,
+    'Q_n': partial(batched_Q_n, k=0.25),
+    'winsorized_mean': partial(batched_winsorized_mean, scale=1.7),
+}
+
+BootstrapResult = namedtuple('BootstrapResult', ['estimate', 'low', 'high', 'replicates'])
+
+# The number of data values drawn per chunk, if chunk_size is not given
+_CHUNK_VALUES = 2 ** 22
+
+
+###############################################################
+#################### Define functions #########################
+###############################################################
+
+# This function applies the statistic to one chunk of resamples, given as a
+# (seed, number of rows) pair
+def _bootstrap_chunk(task, data, statistic):
+    seed, rows = task
+    rng = np.random.default_rng(seed)
+    index = rng.integers(0, len(data), size=(rows, len(data)))
+    return statistic(data[index])
+
+
+# This function applies the statistic to the leave-one-out samples i in
+# [start, stop)
+def _jackknife_chunk(bounds, data, statistic):
+    start, stop = bounds
+    n = len(data)
+    cols = np.arange(n - 1)
+    index = cols[None, :] + (cols[None, :] >= np.arange(start, stop)[:, None])
+    return statistic(data[index])
+
+
+# This function maps func over the tasks, in this process or on a pool
+def map_tasks(func, tasks, n_workers, executor):
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if n_workers == 1 or len(tasks) <= 1:
+        return [func(task) for task in tasks]
+
+    pool_class = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}[executor]
+    with pool_class(max_workers=min(n_workers, len(tasks))) as pool:
+        return list(pool.map(func, tasks))
+
+
+# This function returns B bootstrap replicates of the statistic
+def bootstrap_replicates(data, statistic, B=10000, seed=None, chunk_size=None, n_workers=None,
+                         executor='thread'):
+    data = np.asarray(data, dtype=float).ravel()
+    statistic = ESTIMATORS.get(statistic, statistic)
+    if chunk_size is None:
+        chunk_size = max(1, _CHUNK_VALUES // len(data))
+
+    rows = [min(chunk_size, B - start) for start in range(0, B, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(rows))
+
+    chunks = map_tasks(partial(_bootstrap_chunk, data=data, statistic=statistic),
+                       list(zip(seeds, rows)), n_workers, executor)
+
+    return np.concatenate(chunks)
+
+
+# This function returns the jackknife (leave-one-out) values of the statistic
+def jackknife_values(data, statistic, chunk_size=None, n_workers=None, executor='thread'):
+    data = np.asarray(data, dtype=float).ravel()
+    statistic = ESTIMATORS.get(statistic, statistic)
+    n = len(data)
+    if chunk_size is None:
+        chunk_size = max(1, _CHUNK_VALUES // n)
+
+    bounds = [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+    chunks = map_tasks(partial(_jackknife_chunk, data=data, statistic=statistic), bounds, n_workers, executor)
+
+    return np.concatenate(chunks)
+
+
+# This function returns a bootstrap confidence interval with coverage 1 - alpha
+# for the statistic, which is either the name of one of ESTIMATORS or a
+# batched function taking a (resamples x n) array and returning one value per
+# row. method is 'percentile' or 'bca' (bias-corrected and accelerated, with
+# the acceleration found by the jackknife).
+def bootstrap_ci(data, statistic, B=10000, alpha=0.05, method='percentile', seed=None,
+                 chunk_size=None, n_workers=None, executor='thread'):
+    data = np.asarray(data, dtype=float).ravel()
+    statistic = ESTIMATORS.get(statistic, statistic)
+    if method not in ('percentile', 'bca'):
+        raise ValueError(f"method must be 'percentile' or 'bca', got {method!r}")
+    if executor not in ('thread', 'process'):
+        raise ValueError(f"executor must be 'thread' or 'process', got {executor!r}")
+
+    estimate = statistic(data[None, :])[0]
+    replicates = bootstrap_replicates(data, statistic, B, seed, chunk_size, n_workers, executor)
+
+    probs = np.array([alpha / 2, 1 - alpha / 2])
+    if method == 'bca':
+        normal = NormalDist()
+
+        # Bias correction, counting ties with the estimate as half below it
+        below = np.mean(replicates < estimate) + 0.5 * np.mean(replicates == estimate)
+        z0 = normal.inv_cdf(min(max(below, 1 / (B + 1)), B / (B + 1)))
+
+        # Acceleration from the skewness of the jackknife values
+        jack = jackknife_values(data, statistic, chunk_size, n_workers, executor)
+        diff = jack.mean() - jack
+        denom = 6 * np.sum(diff ** 2) ** 1.5
+        a = np.sum(diff ** 3) / denom if denom > 0 else 0.0
+
+        z = np.array([normal.inv_cdf(p) for p in probs])
+        probs = np.array([normal.cdf(v) for v in z0 + (z0 + z) / (1 - a * (z0 + z))])
+
+    low, high = np.quantile(replicates, probs)
+
+    return BootstrapResult(estimate, low, high, replicates)
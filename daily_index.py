@@ -0,0 +1,213 @@
+'''
+DAILY INDEX
+
+A persistent index of the per-day aggregates of a weather station log (see weather_data.py)
+which only ever grows by having readings appended. For every day and every column it keeps
+the count, sum, min and max of the readings and a mergeable QuantileSketch (from
+streaming_estimators.py) for approximate daily medians and quantiles.
+
+The index remembers the byte offset up to which the log has been read. When it is refreshed
+only the new tail of the file is parsed and merged into the existing days, so after the
+first run the daily means (and so the median and Winsorized mean of the daily means printed
+by weather_simulation.py) are available almost immediately. A final line which is still
+being written (no newline yet) is left for the next refresh, unless the log is known to be
+finished (include_partial=True), when it is counted; if such a log grows afterwards the line
+may have been extended, so the index is rebuilt. The index is also rebuilt from scratch if
+the log has been replaced (its header changed or it got shorter).
+
+The index is pickled to <log>.index, and the daily sketches to one file per month in the
+directory <log>.index.sketches. A month is only loaded when a quantile of one of its days is
+asked for or new readings for it arrive, and a refresh only rewrites the months its new
+readings touch, so appending to the log costs the same however long its history is.
+
+A save writes the changed months to new files named with a generation number, then replaces
+the index (which records the file of each month) in one rename, and only then deletes the
+files the new index no longer uses. A crash at any point leaves the previous index and every
+month file it refers to as they were, so the next refresh simply reads the same tail again.
+
+'''
+
+
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from streaming_estimators import QuantileSketch
+from weather_data import DATE_FORMAT, CHUNK_BYTES, group_by_day, iter_chunks, merge_daily
+
+
+class DailyIndex:
+
+    def __init__(self, source, index_path=None, relative_accuracy=0.01, date_format=DATE_FORMAT):
+        self.source = source
+        self.index_path = source + '.index' if index_path is None else index_path
+        self.relative_accuracy = relative_accuracy
+        self.date_format = date_format
+        self.generation = 0
+        self._reset(b'')
+
+    # This function loads the index of the source log from index_path if it
+    # exists (otherwise starts a new one), and brings it up to date (see
+    # refresh for include_partial)
+    @classmethod
+    def open(cls, source, index_path=None, include_partial=False, **kwargs):
+        index = cls(source, index_path, **kwargs)
+        if os.path.exists(index.index_path):
+            with open(index.index_path, 'rb') as f:
+                stored = pickle.load(f)
+            if (stored.source, stored.relative_accuracy) == (source, index.relative_accuracy):
+                stored.index_path = index.index_path
+                index = stored
+        return index.refresh(include_partial)
+
+    def _reset(self, header):
+        self.header = header
+        self.columns = [name.strip() for name in header.decode().strip().split(',')[1:]]
+        self.offset = len(header)
+        self.days = np.empty(0, dtype='datetime64[D]')
+        self.count = np.empty((0, len(self.columns)), dtype=np.int64)
+        self.sum = np.empty((0, len(self.columns)))
+        self.min = np.empty((0, len(self.columns)))
+        self.max = np.empty((0, len(self.columns)))
+        self.partial = False
+        self._files = {}
+        self._months = {}
+        self._dirty = set()
+
+    @property
+    def sketch_dir(self):
+        return self.index_path + '.sketches'
+
+    # This function returns the sketches of the days of a month (e.g.
+    # '2012-01'), a dict from day to a list of one sketch per column, loading
+    # the month from the file the index records for it the first time it is
+    # needed
+    def _month(self, month):
+        if month not in self._months:
+            if month in self._files:
+                with open(os.path.join(self.sketch_dir, self._files[month]), 'rb') as f:
+                    self._months[month] = pickle.load(f)
+            else:
+                self._months[month] = {}
+        return self._months[month]
+
+    # This function returns the sketches of every column on day (a
+    # datetime64[D])
+    def sketches(self, day):
+        return self._month(str(day)[:7])[day.item()]
+
+    # This function reads any readings appended to the log since the last
+    # refresh, and saves the index if anything changed. A final line without a
+    # newline is only counted if include_partial is True, for a log which is
+    # known to be finished.
+    def refresh(self, include_partial=False):
+        with open(self.source, 'rb') as f:
+            header = f.readline()
+        size = os.path.getsize(self.source)
+
+        if header != self.header or size < self.offset or (self.partial and size != self.offset):
+            self._reset(header)
+        if size == self.offset:
+            return self
+
+        start = self.offset
+        for times, values, end in iter_chunks(self.source, start=self.offset, chunk_bytes=CHUNK_BYTES,
+                                              date_format=self.date_format, include_partial=include_partial):
+            self._add(times, values)
+            self.offset = end
+
+        if self.offset != start:
+            with open(self.source, 'rb') as f:
+                f.seek(self.offset - 1)
+                self.partial = f.read(1) != b'\n'
+            self.save()
+        return self
+
+    # This function merges a block of readings into the index
+    def _add(self, times, values):
+        part = group_by_day(times, values)
+        merged = merge_daily([(self.days, self.count, self.sum, self.min, self.max), part])
+        self.days, self.count, self.sum, self.min, self.max = merged
+
+        # The readings are sorted by day once and split into days, rather than
+        # selected with a mask for every day
+        days = np.asarray(times).astype('datetime64[D]')
+        order = np.argsort(days, kind='stable')
+        unique_days, starts = np.unique(days[order], return_index=True)
+        for day, on_day in zip(unique_days, np.split(np.asarray(values)[order], starts[1:])):
+            month = str(day)[:7]
+            sketches = self._month(month).setdefault(day.item(), [QuantileSketch(self.relative_accuracy)
+                                                                  for _ in self.columns])
+            for sketch, column in zip(sketches, on_day.T):
+                sketch.update(column)
+            self._dirty.add(month)
+
+    # This function writes the months of sketches changed since the last save
+    # to new files in sketch_dir, named with a generation number above any
+    # already there, then the index to index_path, and last removes the files
+    # of sketch_dir which the new index does not use (older versions of its
+    # months, the months of an index since rebuilt, and files left by a crash)
+    def save(self):
+        os.makedirs(self.sketch_dir, exist_ok=True)
+        existing = os.listdir(self.sketch_dir)
+        self.generation = max([self.generation] + [_generation(name) for name in existing]) + 1
+        for month in sorted(self._dirty):
+            name = f'{month}.{self.generation}.pkl'
+            _dump(self._months[month], os.path.join(self.sketch_dir, name))
+            self._files[month] = name
+        self._dirty = set()
+        _dump(self, self.index_path)
+
+        used = set(self._files.values())
+        for name in existing:
+            if name not in used:
+                os.remove(os.path.join(self.sketch_dir, name))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_months'] = {}
+        state['_dirty'] = set()
+        return state
+
+    def _column(self, column):
+        return self.columns.index(column) if isinstance(column, str) else column
+
+    # This function returns the mean of every column on every day, as a
+    # (days x columns) array
+    @property
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sum / self.count
+
+    # This function returns the approximate q-quantile of a column (given by
+    # name or position) on every day, from the daily sketches
+    def quantile(self, column, q):
+        j = self._column(column)
+        return np.array([self.sketches(day)[j].quantile(q) for day in self.days])
+
+    # This function returns the approximate median of a column on every day
+    def median(self, column):
+        j = self._column(column)
+        return np.array([self.sketches(day)[j].median() for day in self.days])
+
+
+# This function returns the generation of a month file of sketch_dir (e.g. 3
+# for '2012-01.3.pkl'), or 0 for any other file
+def _generation(name):
+    parts = name.split('.')
+    return int(parts[1]) if len(parts) == 3 and parts[1].isdigit() else 0
+
+
+# This function pickles obj to path, via a temporary file
+def _dump(obj, path):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
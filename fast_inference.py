@@ -0,0 +1,137 @@
+'''
+FAST INFERENCE
+
+Cheap alternatives to pm.sample for screening many model configurations (priors in
+prior_testing2.py, alphas in Likelihood_alpha_testing.py) before running full MCMC on the
+interesting ones. The backend is chosen by name:
+
+    'nuts'      pm.sample, as before
+    'laplace'   a normal approximation at the MAP, with covariance the inverse Hessian of
+                the negative log posterior (pm.find_MAP and pm.find_hessian)
+    'advi'      mean-field ADVI (pm.fit)
+
+Every fast run also draws a small NUTS reference sample, and reports how far the fast
+posterior of the shared parameter is from it: the 1-Wasserstein distance between the draws
+and the KL divergence between normal fits to them. The fast result is flagged as
+trustworthy when the Wasserstein distance is below tolerance times the reference SD.
+
+'''
+
+
+from collections import namedtuple
+
+import numpy as np
+from scipy.stats import wasserstein_distance
+
+
+BACKENDS = ('nuts', 'laplace', 'advi')
+
+FitResult = namedtuple('FitResult', ['trace', 'report'])
+
+
+###############################################################
+######################### Backends ############################
+###############################################################
+
+# This function returns chains x draws of each free variable from a normal
+# approximation at the MAP of the model
+def _laplace(model, draws, chains, seed):
+    import pymc as pm
+    import arviz as az
+
+    if any(model.rvs_to_transforms.get(rv) is not None for rv in model.free_RVs):
+        raise ValueError('the Laplace backend only supports models without transformed variables')
+
+    point = pm.find_MAP(model=model, progressbar=False)
+    names = [rv.name for rv in model.free_RVs]
+    sizes = [np.size(point[name]) for name in names]
+    mean = np.concatenate([np.ravel(point[name]) for name in names])
+    hessian = np.atleast_2d(pm.find_hessian(point, vars=model.free_RVs, model=model))
+    cov = np.linalg.inv(hessian)
+
+    rng = np.random.default_rng(seed)
+    samples = rng.multivariate_normal(mean, cov, size=(chains, draws))
+    posterior = {}
+    for name, start, size in zip(names, np.cumsum([0] + sizes[:-1]), sizes):
+        shape = (chains, draws) + np.shape(point[name])
+        posterior[name] = samples[..., start:start + size].reshape(shape)
+    return az.from_dict(posterior=posterior)
+
+
+# This function returns chains x draws from a mean-field ADVI fit of the model
+def _advi(model, draws, chains, seed, iterations):
+    import pymc as pm
+    import arviz as az
+
+    approx = pm.fit(n=iterations, method='advi', model=model, random_seed=seed, progressbar=False)
+    trace = approx.sample(draws * chains, random_seed=seed)
+
+    # The draws come back as one chain, which is split into chains
+    posterior = trace.posterior.stack(sample=('chain', 'draw')).transpose('sample', ...)
+    values = {name: posterior[name].values.reshape((chains, draws) + posterior[name].shape[1:])
+              for name in posterior.data_vars}
+    return az.from_dict(posterior=values)
+
+
+###############################################################
+#################### Accuracy report ##########################
+###############################################################
+
+# This function returns the KL divergence from a normal fit to p to a normal
+# fit to q
+def _normal_kl(p, q):
+    mp, sp = np.mean(p), np.std(p)
+    mq, sq = np.mean(q), np.std(q)
+    return np.log(sq / sp) + (sp ** 2 + (mp - mq) ** 2) / (2 * sq ** 2) - 0.5
+
+
+# This function compares the draws of var_name in a fast trace against those
+# in a reference trace
+def accuracy_report(trace, reference, var_name='mu', backend=None, tolerance=0.2):
+    fast = np.ravel(trace.posterior[var_name].values)
+    ref = np.ravel(reference.posterior[var_name].values)
+    distance = wasserstein_distance(fast, ref)
+    return {
+        'backend': backend,
+        'mean': np.mean(fast),
+        'reference_mean': np.mean(ref),
+        'sd': np.std(fast),
+        'reference_sd': np.std(ref),
+        'wasserstein': distance,
+        'kl_normal': _normal_kl(fast, ref),
+        'trustworthy': bool(distance <= tolerance * np.std(ref)),
+    }
+
+
+###############################################################
+#################### Define functions #########################
+###############################################################
+
+# This function runs inference on the model (the current model context if
+# None) with the backend, returning the trace and, for the fast backends, the
+# accuracy report for var_name against a NUTS reference of reference_draws
+# draws per chain (skipped if reference_draws is 0)
+def fit(model=None, backend='nuts', draws=1000, chains=2, seed=None, var_name='mu', reference_draws=200,
+        reference_tune=500, advi_iterations=20000, tolerance=0.2, **sample_kwargs):
+    import pymc as pm
+
+    if backend not in BACKENDS:
+        raise ValueError(f'backend must be one of {BACKENDS}, got {backend!r}')
+    model = pm.modelcontext(model)
+
+    if backend == 'nuts':
+        trace = pm.sample(draws, chains=chains, random_seed=seed, model=model, progressbar=False,
+                          **sample_kwargs)
+        return FitResult(trace, None)
+
+    if backend == 'laplace':
+        trace = _laplace(model, draws, chains, seed)
+    else:
+        trace = _advi(model, draws, chains, seed, advi_iterations)
+
+    report = None
+    if reference_draws:
+        reference = pm.sample(reference_draws, tune=reference_tune, chains=chains, cores=1, random_seed=seed,
+                              model=model, progressbar=False, compute_convergence_checks=False)
+        report = accuracy_report(trace, reference, var_name, backend, tolerance)
+    return FitResult(trace, report)
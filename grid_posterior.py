@@ -0,0 +1,208 @@
+'''
+GRID POSTERIOR
+
+A fast path for the one-parameter posteriors of Figures 3.1 and 3.3 (prior_testing2.py and
+Likelihood_alpha_testing.py), which only infer a scalar mu and so do not need MCMC. The log
+prior plus the tempered log likelihood (see tempered_likelihood.py) is evaluated on a grid of
+mu, for the whole data set and any number of alphas at once, and normalised with log-sum-exp
+and trapezoid weights. The grid is adaptive: it starts wide, is widened if the posterior
+reaches its edge, and is then zoomed in on the region holding all but exp(-cutoff) of the
+peak density until the posterior fills it, so every grid point lands where the mass is.
+
+From the grid come the density, mean, SD and highest density interval (with the arviz
+default probability of 0.94), and to_inference_data turns the result into draws in an
+arviz InferenceData, so the plotting code written for pm.sample traces works unchanged.
+grid_posterior_2d does the same for a two-parameter log density on a grid of both.
+
+'''
+
+
+from collections import namedtuple
+
+import numpy as np
+from scipy.special import logsumexp
+
+from tempered_likelihood import logpdf, tempered_loglik
+
+
+GridPosterior = namedtuple('GridPosterior', ['grid', 'log_density', 'density', 'mean', 'sd', 'hdi'])
+
+GridPosterior2D = namedtuple('GridPosterior2D', ['x', 'y', 'log_density', 'density', 'marginals'])
+
+# The prior used if none is given, a standard normal on mu
+DEFAULT_PRIOR = {'family': 'normal', 'mu': 0.0, 'sigma': 1.0}
+
+
+###############################################################
+##################### Helper functions ########################
+###############################################################
+
+# This function returns the trapezoid rule weights of a uniform grid
+def _trapezoid_weights(grid):
+    weights = np.full(len(grid), grid[1] - grid[0])
+    weights[[0, -1]] /= 2
+    return weights
+
+
+# This function normalises log densities on a grid (over the last axis) so
+# that they integrate to one with the trapezoid rule
+def _normalise(log_p, weights):
+    return log_p - logsumexp(log_p + np.log(weights), axis=-1, keepdims=True)
+
+
+# This function returns the first and last grid points where any of the log
+# densities (over the last axis) is within cutoff of its own peak
+def _support(log_p, cutoff):
+    peak = np.max(log_p, axis=-1, keepdims=True)
+    return _edges((log_p > peak - cutoff).reshape(-1, log_p.shape[-1]).any(axis=0))
+
+
+# This function returns the first and last True positions of a boolean array
+def _edges(inside):
+    index = np.flatnonzero(inside)
+    return index[0], index[-1]
+
+
+# This function returns the smallest interval holding prob of the mass, made
+# of the grid points of highest density (so it assumes one mode)
+def _hdi(grid, density, weights, prob):
+    mass = density * weights
+    order = np.argsort(-density, axis=-1)
+    cumulative = np.cumsum(np.take_along_axis(mass, order, axis=-1), axis=-1)
+    needed = np.sum(cumulative < prob * cumulative[..., -1:], axis=-1, keepdims=True) + 1
+
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(order.shape[-1]) + np.zeros_like(order), axis=-1)
+    inside = rank < needed
+    low = np.min(np.where(inside, grid, np.inf), axis=-1)
+    high = np.max(np.where(inside, grid, -np.inf), axis=-1)
+    return np.stack([low, high], axis=-1)
+
+
+# This function returns the mean, SD and HDI of normalised densities on a grid
+def _summarise(grid, log_density, hdi_prob):
+    weights = _trapezoid_weights(grid)
+    density = np.exp(log_density)
+    mean = np.sum(density * weights * grid, axis=-1)
+    var = np.sum(density * weights * (grid - mean[..., None]) ** 2, axis=-1)
+    hdi = _hdi(grid, density, weights, hdi_prob)
+    return GridPosterior(grid, log_density, density, mean, np.sqrt(var), hdi)
+
+
+# This function adapts the bounds [lo, hi] of a grid of n_points to the log
+# density log_p (a function of the grid), returning the final grid and log
+# density. The bounds are doubled outwards while the density reaches an edge,
+# and shrunk to the support while it fills less than half of the grid.
+def _adapt(log_p, lo, hi, n_points, cutoff, max_rounds):
+    for _ in range(max_rounds):
+        grid = np.linspace(lo, hi, n_points)
+        values = log_p(grid)
+        first, last = _support(values, cutoff)
+
+        width = hi - lo
+        if first == 0 or last == n_points - 1:
+            lo, hi = lo - width * (first == 0), hi + width * (last == n_points - 1)
+            continue
+        if last - first >= (n_points - 1) / 2:
+            break
+        lo, hi = grid[first - 1], grid[last + 1]
+
+    return grid, values
+
+
+###############################################################
+#################### Define functions #########################
+###############################################################
+
+# This function returns the posterior of mu on an adaptive grid, for the prior
+# (a dict of logpdf arguments: family, mu, sigma and any extra parameter, e.g.
+# {'family': 't', 'mu': 0, 'sigma': 0.289, 'nu': 3}) and the likelihood family
+# with scale sigma raised to the power alpha. alpha may be an array, in which
+# case every field but the grid has alpha's shape in front.
+def grid_posterior(data, alpha=1.0, likelihood='cauchy', sigma=1.0, prior=None, bounds=None,
+                   n_points=512, hdi_prob=0.94, cutoff=30.0, max_rounds=12, **params):
+    data = np.asarray(data, dtype=float).ravel()
+    prior = DEFAULT_PRIOR if prior is None else prior
+
+    def log_p(grid):
+        return logpdf(grid, **prior) + tempered_loglik(data, grid, alpha, likelihood, sigma, **params)
+
+    if bounds is None:
+        spread = 50 * prior.get('sigma', 1.0)
+        lo = min(prior.get('mu', 0.0) - spread, data.min(initial=np.inf))
+        hi = max(prior.get('mu', 0.0) + spread, data.max(initial=-np.inf))
+    else:
+        lo, hi = bounds
+
+    grid, values = _adapt(log_p, lo, hi, n_points, cutoff, max_rounds)
+    return _summarise(grid, _normalise(values, _trapezoid_weights(grid)), hdi_prob)
+
+
+# This function returns the posterior of two parameters (x, y) on an adaptive
+# grid, for a log density log_p(x, y) which broadcasts over arrays, starting
+# from bounds ((x_lo, x_hi), (y_lo, y_hi)). The marginals of x and y are
+# summarised as by grid_posterior.
+def grid_posterior_2d(log_p, bounds, n_points=(256, 256), hdi_prob=0.94, cutoff=30.0, max_rounds=12):
+    (x_lo, x_hi), (y_lo, y_hi) = bounds
+    nx, ny = n_points
+
+    for _ in range(max_rounds):
+        x = np.linspace(x_lo, x_hi, nx)
+        y = np.linspace(y_lo, y_hi, ny)
+        values = log_p(x[:, None], y[None, :])
+
+        # The support is of the joint density, within cutoff of its global
+        # peak, projected onto each axis
+        inside = values > np.max(values) - cutoff
+        x_first, x_last = _edges(inside.any(axis=1))
+        y_first, y_last = _edges(inside.any(axis=0))
+
+        edges = [x_first == 0, x_last == nx - 1, y_first == 0, y_last == ny - 1]
+        if any(edges):
+            x_width, y_width = x_hi - x_lo, y_hi - y_lo
+            x_lo, x_hi = x_lo - x_width * edges[0], x_hi + x_width * edges[1]
+            y_lo, y_hi = y_lo - y_width * edges[2], y_hi + y_width * edges[3]
+            continue
+        if x_last - x_first >= (nx - 1) / 2 and y_last - y_first >= (ny - 1) / 2:
+            break
+        x_lo, x_hi = x[x_first - 1], x[x_last + 1]
+        y_lo, y_hi = y[y_first - 1], y[y_last + 1]
+
+    x_weights = _trapezoid_weights(x)
+    y_weights = _trapezoid_weights(y)
+    log_weights = np.log(x_weights)[:, None] + np.log(y_weights)[None, :]
+    log_density = values - logsumexp(values + log_weights)
+
+    marginals = (
+        _summarise(x, _normalise(logsumexp(log_density + np.log(y_weights), axis=1), x_weights), hdi_prob),
+        _summarise(y, _normalise(logsumexp(log_density.T + np.log(x_weights), axis=1), y_weights), hdi_prob),
+    )
+    return GridPosterior2D(x, y, log_density, np.exp(log_density), marginals)
+
+
+# This function returns chains x draws samples from a grid posterior, by
+# inverting its (piecewise linear) CDF, with the shape (chains, draws) plus
+# any leading shape of the posterior (e.g. alpha) at the end
+def sample_grid(result, draws=1000, chains=4, seed=None):
+    rng = np.random.default_rng(seed)
+    grid = result.grid
+    density = result.density.reshape(-1, len(grid))
+    cdf = np.zeros_like(density)
+    cdf[:, 1:] = np.cumsum((density[:, 1:] + density[:, :-1]) / 2 * np.diff(grid), axis=1)
+
+    samples = np.empty((chains, draws, len(density)))
+    for i, row in enumerate(cdf):
+        samples[..., i] = np.interp(rng.uniform(0, row[-1], size=(chains, draws)), row, grid)
+    return samples.reshape((chains, draws) + result.density.shape[:-1])
+
+
+# This function returns draws from a grid posterior as an arviz InferenceData
+# with the variable var_name. For a posterior with a leading shape (e.g. a
+# grid of alphas), give the names and values of its dimensions in dims and
+# coords, e.g. dims=['alpha'], coords={'alpha': alpha_values}.
+def to_inference_data(result, var_name='mu', draws=1000, chains=4, seed=None, dims=None, coords=None):
+    import arviz as az
+
+    samples = sample_grid(result, draws, chains, seed)
+    return az.from_dict(posterior={var_name: samples}, coords=coords,
+                        dims=None if dims is None else {var_name: list(dims)})
@@ -0,0 +1,159 @@
+'''
+LOSS KERNELS
+
+Vectorised versions of the loss functions of Figure 2.4 (Loss_funcs.py), together with their
+influence functions psi (the derivative of the loss rho) and the IRLS weights w(x) = psi(x) / x,
+for the squared, absolute, Huber and Tukey losses. These are the inner loop of the
+M-estimators, so every kernel is written without branches or Python loops, works on arrays of
+any shape, keeps float32 input in float32 (anything else is computed in float64), and can write
+its result into a preallocated out array (which may be the input itself).
+
+The losses are scaled as in Loss_funcs.py, so the squared loss is x^2 (psi = 2x) while the
+Huber loss is x^2 / 2 near zero (psi = x). Every kernel takes the tuning constant c, which the
+squared and absolute losses ignore, so that they can all be used in the same way.
+
+'''
+
+
+from collections import namedtuple
+
+import numpy as np
+
+
+# The three kernels of a loss
+Loss = namedtuple('Loss', ['rho', 'psi', 'weight'])
+
+
+# This function returns the input as a float32 or float64 array, the array to
+# write the result to, and c in the same dtype as the input
+def _prepare(x, out, c=None):
+    x = np.asarray(x)
+    if x.dtype not in (np.float32, np.float64):
+        x = x.astype(np.float64)
+    if out is None:
+        out = np.empty_like(x)
+    elif out.shape != x.shape:
+        raise ValueError(f'out has shape {out.shape}, expected {x.shape}')
+    if c is not None:
+        c = x.dtype.type(c)
+    return x, out, c
+
+
+###############################################################
+######################## Squared loss #########################
+###############################################################
+
+def squared_rho(x, c=None, out=None):
+    x, out, _ = _prepare(x, out)
+    return np.square(x, out=out)
+
+
+def squared_psi(x, c=None, out=None):
+    x, out, _ = _prepare(x, out)
+    return np.multiply(x, 2, out=out)
+
+
+def squared_weight(x, c=None, out=None):
+    x, out, _ = _prepare(x, out)
+    out[...] = 2
+    return out
+
+
+###############################################################
+####################### Absolute loss #########################
+###############################################################
+
+def absolute_rho(x, c=None, out=None):
+    x, out, _ = _prepare(x, out)
+    return np.abs(x, out=out)
+
+
+def absolute_psi(x, c=None, out=None):
+    x, out, _ = _prepare(x, out)
+    return np.sign(x, out=out)
+
+
+# The weight 1 / |x| is unbounded at zero, so |x| is floored at the machine
+# epsilon of the dtype to keep the weights finite
+def absolute_weight(x, c=None, out=None):
+    x, out, _ = _prepare(x, out)
+    a = np.abs(x)
+    np.maximum(a, np.finfo(x.dtype).eps, out=a)
+    return np.divide(1, a, out=out)
+
+
+###############################################################
+######################### Huber loss ##########################
+###############################################################
+
+# With a = |x| and m = min(a, c), the Huber loss is m * (a - m / 2), which is
+# x^2 / 2 when |x| <= c and c * (|x| - c / 2) otherwise
+def huber_rho(x, c, out=None):
+    x, out, c = _prepare(x, out, c)
+    a = np.abs(x)
+    np.minimum(a, c, out=out)
+    a *= 2
+    a -= out
+    a *= 0.5
+    out *= a
+    return out
+
+
+def huber_psi(x, c, out=None):
+    x, out, c = _prepare(x, out, c)
+    return np.clip(x, -c, c, out=out)
+
+
+# The Huber weight is min(1, c / |x|) = c / max(|x|, c)
+def huber_weight(x, c, out=None):
+    x, out, c = _prepare(x, out, c)
+    a = np.abs(x)
+    np.maximum(a, c, out=a)
+    return np.divide(c, a, out=out)
+
+
+###############################################################
+######################### Tukey loss ##########################
+###############################################################
+
+# This function returns 1 - u, where u = min((x / c)^2, 1), so that the Tukey
+# kernels are all powers of it (and it is zero for |x| >= c)
+def _tukey_v(x, c):
+    v = np.divide(x, c)
+    np.square(v, out=v)
+    np.minimum(v, 1, out=v)
+    return np.subtract(1, v, out=v)
+
+
+# The Tukey loss is c^2 / 6 * (1 - (1 - u)^3)
+def tukey_rho(x, c, out=None):
+    x, out, c = _prepare(x, out, c)
+    v = _tukey_v(x, c)
+    np.square(v, out=out)
+    out *= v
+    np.subtract(1, out, out=out)
+    out *= c ** 2 / 6
+    return out
+
+
+# The Tukey psi is x * (1 - u)^2
+def tukey_psi(x, c, out=None):
+    x, out, c = _prepare(x, out, c)
+    v = _tukey_v(x, c)
+    np.square(v, out=v)
+    return np.multiply(x, v, out=out)
+
+
+# The Tukey weight is (1 - u)^2
+def tukey_weight(x, c, out=None):
+    x, out, c = _prepare(x, out, c)
+    return np.square(_tukey_v(x, c), out=out)
+
+
+# The kernels of every loss, by name
+LOSSES = {
+    'squared': Loss(squared_rho, squared_psi, squared_weight),
+    'absolute': Loss(absolute_rho, absolute_psi, absolute_weight),
+    'huber': Loss(huber_rho, huber_psi, huber_weight),
+    'tukey': Loss(tukey_rho, tukey_psi, tukey_weight),
+}
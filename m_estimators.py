@@ -0,0 +1,177 @@
+'''
+M-ESTIMATORS
+
+In this code we use the Huber and Tukey losses of Figure 2.4 (through the kernels in
+loss_kernels.py) to estimate location. The location is found by iteratively reweighted
+least squares (IRLS), starting from the median, with the scale fixed at the normalised MAD,
+or estimated jointly with the location by Huber's Proposal 2.
+
+As in batched_estimators.py, many independent samples can be solved at once: the input is
+a 2-D array with one sample per row, a flat values array plus offsets, or a values array
+plus a group id for every value. Every sample keeps its own convergence flag, and once a
+sample has converged it is dropped from the arrays used by later iterations, so the cost of
+each iteration shrinks with the number of samples still being solved.
+
+'''
+
+
+from collections import namedtuple
+from statistics import NormalDist
+
+import numpy as np
+
+from batched_estimators import (prepare_samples, sample_sums, sample_mins, expand_samples, sample_medians,
+                                select_samples)
+from loss_kernels import LOSSES
+
+
+# The default tuning constants, giving 95% efficiency at the normal
+TUNING = {'huber': 1.345, 'tukey': 4.685}
+
+# The factor making the MAD a consistent estimator of the SD for normal data
+_MAD_TO_SD = 1 / NormalDist().inv_cdf(0.75)
+
+MResult = namedtuple('MResult', ['location', 'scale', 'n_iter', 'converged', 'groups'])
+
+
+###############################################################
+##################### Helper functions ########################
+###############################################################
+
+# This function sorts values by their group ids, returning the sorted values,
+# the offsets of each group and the group ids in that order
+def _from_groups(values, groups):
+    values = np.asarray(values, dtype=float).ravel()
+    groups = np.asarray(groups).ravel()
+    if len(groups) != len(values):
+        raise ValueError(f'got {len(groups)} group ids for {len(values)} values')
+    order = np.argsort(groups, kind='stable')
+    keys, counts = np.unique(groups[order], return_counts=True)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    return values[order], offsets, keys
+
+
+# This function returns E[psi(Z)^2] for the Huber psi and a standard normal Z,
+# which makes the Proposal 2 scale consistent for the SD at the normal
+def _huber_beta(c):
+    normal = NormalDist()
+    tail = 1 - normal.cdf(c)
+    return 1 - 2 * tail - 2 * c * normal.pdf(c) + 2 * c ** 2 * tail
+
+
+# This function returns the next Proposal 2 location and scale of every
+# sample, from the residuals r standardised by the current location mu and
+# scale s. With the points beyond c held fixed (their psi is +-c whatever mu
+# and s are), the two Proposal 2 equations become
+#     sum psi(r) = 0:              mu = m + b s,  m the mean of the m_inner unclipped
+#                                  x, b = c (n_above - n_below) / m_inner
+#     sum psi(r)^2 = beta (n - 1): sum of unclipped (x - mu)^2 = D s^2,
+#                                  D = beta (n - 1) - c^2 n_clipped
+# whose joint solution is s^2 = S / (D - m_inner b^2), with S the sum of the
+# unclipped (x - m)^2. Solving them exactly for the current clipped points is
+# a Newton step on the piecewise linear equations, which settles as soon as the
+# clipped points settle. Reweighting the location and the fixed-point scale
+# step s^2 <- s^2 mean(psi^2) / beta instead crawl when the clipped points
+# nearly balance the rest. Where there is no exact solution, too many points
+# are clipped for any scale on this piece, so the location is reweighted and
+# the scale grows at least to where the nearest clipped point comes inside.
+def _proposal2_step(x, r, mu, s, c, beta, offsets, lengths):
+    above = r > c
+    below = r < -c
+    inner = ~(above | below)
+    n_inner = sample_sums(inner.astype(float), offsets)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        m = sample_sums(np.where(inner, x, 0.0), offsets) / n_inner
+        b = c * sample_sums(above.astype(float) - below.astype(float), offsets) / n_inner
+        d = np.where(inner, x - expand_samples(m, offsets, lengths), 0.0)
+        spread = sample_sums(d * d, offsets)
+        denominator = beta * (lengths - 1) - c * c * (lengths - n_inner) - n_inner * b * b
+        exact_s = np.sqrt(spread / denominator)
+    exact = (n_inner > 0) & (spread > 0) & (denominator > 0)
+
+    w = LOSSES['huber'].weight(r, c)
+    fixed_point_mu = sample_sums(w * x, offsets) / sample_sums(w, offsets)
+    fixed_point_s = s * np.sqrt(sample_sums(np.clip(r, -c, c) ** 2, offsets) / (beta * (lengths - 1)))
+    nearest = s * sample_mins(np.where(inner, np.inf, np.abs(r)), offsets) / c
+    fixed_point_s = np.maximum(fixed_point_s, np.where(np.isfinite(nearest), nearest, 0.0))
+    return np.where(exact, m + b * exact_s, fixed_point_mu), np.where(exact, exact_s, fixed_point_s)
+
+
+###############################################################
+#################### Define functions #########################
+###############################################################
+
+# This function returns the M-estimate of location of every sample, for the
+# loss 'huber' or 'tukey' with tuning constant c. The scale is the normalised
+# MAD of each sample, or, if proposal2 is True (Huber loss only), it is updated
+# together with the location by Huber's Proposal 2. A sample has converged
+# when an iteration moves its location (and scale) by at most tol times its
+# scale. Samples with a MAD of zero keep their median.
+#
+# The samples are given as a 2-D array (one per row), as values and offsets
+# (as in batched_estimators.py), or as values and groups, a group id for every
+# value. In the last case the results are in the order of the sorted group ids,
+# which are returned as the groups field.
+def batched_m_estimate(data, offsets=None, groups=None, loss='huber', c=None, proposal2=False,
+                       tol=1e-8, max_iter=100):
+    if loss not in TUNING:
+        raise ValueError(f'loss must be one of {sorted(TUNING)}, got {loss!r}')
+    if proposal2 and loss != 'huber':
+        raise ValueError('Proposal 2 is only defined here for the Huber loss')
+    if groups is not None:
+        if offsets is not None:
+            raise ValueError('give either offsets or groups, not both')
+        data, offsets, groups = _from_groups(data, groups)
+
+    data, offsets, lengths = prepare_samples(data, offsets)
+    kernels = LOSSES[loss]
+    c = TUNING[loss] if c is None else c
+    beta = _huber_beta(c) if proposal2 else None
+
+    location = sample_medians(data, offsets, lengths)
+    spread = np.abs(data - expand_samples(location, offsets, lengths))
+    scale = _MAD_TO_SD * sample_medians(spread, offsets, lengths)
+    n_iter = np.zeros(len(lengths), dtype=np.intp)
+    converged = scale == 0
+
+    # The data of the samples still being solved, and their positions
+    active = np.flatnonzero(~converged)
+    x, x_offsets, x_lengths = select_samples(data, offsets, lengths, ~converged)
+
+    for _ in range(max_iter):
+        if len(active) == 0:
+            break
+        mu = location[active]
+        s = scale[active]
+        r = (x - expand_samples(mu, x_offsets, x_lengths)) / expand_samples(s, x_offsets, x_lengths)
+
+        if proposal2:
+            new_mu, new_s = _proposal2_step(x, r, mu, s, c, beta, x_offsets, x_lengths)
+        else:
+            w = kernels.weight(r, c, out=r)
+            total = sample_sums(w, x_offsets)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                new_mu = np.where(total > 0, sample_sums(w * x, x_offsets) / total, mu)
+
+        done = np.abs(new_mu - mu) <= tol * s
+        location[active] = new_mu
+        if proposal2:
+            done &= np.abs(new_s - s) <= tol * s
+            scale[active] = new_s
+        n_iter[active] += 1
+        converged[active[done]] = True
+
+        active = active[~done]
+        x, x_offsets, x_lengths = select_samples(x, x_offsets, x_lengths, ~done)
+
+    return MResult(location, scale, n_iter, converged, groups)
+
+
+# This function returns the M-estimate of location (and scale) of one sample,
+# as batched_m_estimate does
+def m_estimate(data, loss='huber', c=None, proposal2=False, tol=1e-8, max_iter=100):
+    data = np.asarray(data, dtype=float).ravel()
+    result = batched_m_estimate(data[None, :], loss=loss, c=c, proposal2=proposal2,
+                                tol=tol, max_iter=max_iter)
+    return MResult(result.location[0], result.scale[0], result.n_iter[0], result.converged[0], None)
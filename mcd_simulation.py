@@ -0,0 +1,151 @@
+'''
+FIG 4.1, 4.2 - SIMULATION
+
+The data generation, estimators and simulation loop of the MCD study in MCD study.ipynb.
+They live here so that they can be imported by the notebook and by other scripts, and so
+that a long sweep can be checkpointed to a ResultStore (result_store.py) and resumed.
+
+'''
+
+import numpy as np
+import pandas as pd
+
+from sklearn.covariance import MinCovDet
+
+##############################################################################
+# 1. Data Generation
+##############################################################################
+
+def generate_data(n, p, contamination=0.0, shift=10.0, seed=None):
+    """
+    Generates n x p data from N(0, I), then contaminates a fraction of points
+    by adding a shift.
+    
+    Returns:
+    --------
+    X        : (n, p) ndarray
+    mu_true  : (p,) the true mean (zeros by default)
+    Sigma_true: (p,p) identity matrix
+    """
+    if seed is not None:
+        np.random.seed(seed)
+
+    mu_true = np.zeros(p)
+    Sigma_true = np.eye(p)
+
+    # Clean data
+    X_clean = np.random.multivariate_normal(mean=mu_true, cov=Sigma_true, size=n)
+
+    # Contamination
+    n_out = int(contamination * n)
+    if n_out > 0:
+        outlier_indices = np.random.choice(n, n_out, replace=False)
+        # Shifted outliers
+        X_outliers = np.random.multivariate_normal(mean=shift * np.ones(p), 
+                                                   cov=Sigma_true, 
+                                                   size=n_out)
+        X_clean[outlier_indices] = X_outliers
+
+    return X_clean, mu_true, Sigma_true
+
+##############################################################################
+# 2. Estimators
+##############################################################################
+
+def classical_estimator(X):
+    """
+    Returns sample mean and sample covariance.
+    """
+    mu_c = np.mean(X, axis=0)
+    Sigma_c = np.cov(X, rowvar=False)
+    return mu_c, Sigma_c
+
+def mcd_estimator(X):
+    """
+    Returns the MCD location and covariance (FastMCD from sklearn).
+    """
+    mcd = MinCovDet(support_fraction=0.5).fit(X)
+    return mcd.location_, mcd.covariance_
+
+# The estimators compared in the study. A new method only needs an entry here.
+METHODS = {
+    'classical': classical_estimator,
+    'mcd': mcd_estimator,
+}
+
+def compute_errors(mu_est, Sigma_est, mu_true, Sigma_true):
+    """
+    Return L2 norm error for location, and Frobenius norm error for covariance.
+    """
+    loc_err = np.linalg.norm(mu_est - mu_true)
+    cov_err = np.linalg.norm(Sigma_est - Sigma_true, 'fro')
+    return loc_err, cov_err
+
+##############################################################################
+# 3. Simulation / Efficiency / Robustness Study
+##############################################################################
+
+def run_simulation(p_values=[2,5,10,15],
+                   n=200, 
+                   contamination_levels=[0.0, 0.05, 0.1, 0.2, 0.25], 
+                   n_sims=100,
+                   seed=None,
+                   store=None):
+    """
+    For each p in p_values, and for each contamination alpha,
+    we generate data, estimate location/cov using every method in METHODS,
+    record errors in location/cov, then return a DataFrame.
+
+    If seed is given, each simulation's data is generated from its own seed
+    derived from (seed, p, alpha, sim), so any cell can be recomputed on its own.
+
+    If a ResultStore (result_store.py) is given, the errors of each
+    (method, p, alpha, sim) cell are written to it as soon as they are
+    computed, and cells already in the store are read back instead. An
+    interrupted sweep then resumes where it stopped, and adding a method to
+    METHODS only computes that method's cells. This needs a fixed seed.
+    """
+    if store is not None and seed is None:
+        raise ValueError('a result store needs a fixed seed')
+
+    records = []
+
+    for p in p_values:
+        for alpha in contamination_levels:
+            for sim in range(n_sims):
+                keys = {method: {'estimator': method, 'scenario': 'shift', 'n': n, 'p': p,
+                                 'contamination': alpha, 'seed': seed, 'sim': sim}
+                        for method in METHODS}
+                todo = list(METHODS) if store is None else [m for m in METHODS if keys[m] not in store]
+
+                errors = {}
+                if todo:
+                    sim_seed = None
+                    if seed is not None:
+                        sim_seed = int(np.random.SeedSequence(
+                            [seed, p, sim, int(round(alpha * 10**6))]).generate_state(1)[0])
+                    X, mu_true, Sigma_true = generate_data(n, p, 
+                                                          contamination=alpha,
+                                                          seed=sim_seed)
+
+                    # In scikit-learn, there's no separate "slow MCD" 
+                    # implementation. It's always the fast one under the hood.
+                    for method in todo:
+                        mu_est, Sigma_est = METHODS[method](X)
+                        errors[method] = compute_errors(mu_est, Sigma_est, mu_true, Sigma_true)
+                        if store is not None:
+                            store.put(keys[method], errors[method])
+
+                for method in METHODS:
+                    loc_err, cov_err = errors[method] if method in errors else store.get(keys[method])
+                    records.append({
+                        'dim': p,
+                        'contamination': alpha,
+                        'sim': sim,
+                        'method': method,
+                        'loc_err': loc_err,
+                        'cov_err': cov_err
+                    })
+                
+    df = pd.DataFrame(records)
+    return df
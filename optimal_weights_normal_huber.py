@@ -13,45 +13,20 @@ import matplotlib.pyplot as plt
 from mpl_toolkits import mplot3d
 import numpy as np
 
-# We will store variances in these lists
-X_t = []
-X_c = []
-X_bar = []
-X_w = []
+from variance_surfaces import variance_grid
 
 # Here I will compare the (expected) variances for the three estimators at different values of epsilon and k
-for e in range(1,31):
-    for k in range(1,6):
-        eps = e/150   # Scale epsilons to be between 0 and 0.2
-        
-        # define the alpha and betas as shown in the report
-        alpha = k/(k+eps-eps*k)
-
-        beta = 1/(k+eps-eps*k)
-
-        # For the given epsilon and k, calculate expected variances and store these in a list.
-        Var_X_t = 1/(1-eps)
-        X_t.append(Var_X_t)
-
-        Var_X_c = k/eps
-        X_c.append(Var_X_c)
-
-        Var_X_bar = 1-eps + k*eps
-        X_bar.append(Var_X_bar)
-
-        Var_X_w = alpha**2*(1-eps) + beta**2 * eps * k 
-        X_w.append(Var_X_w)
-
-
-
 K = np.arange(1, 6)
-E = np.arange(1, 31) / 150
-
-# Reshape the data into a 2D grid, so that we can plot properly
-X_c = np.array(X_c).reshape((len(E), len(K)))
-X_t = np.array(X_t).reshape((len(E), len(K)))
-X_bar = np.array(X_bar).reshape((len(E), len(K)))
-X_w = np.array(X_w).reshape((len(E), len(K)))
+E = np.arange(1, 31) / 150   # Scale epsilons to be between 0 and 0.2
+
+# The expected variances on the whole grid, as (len(E) x len(K)) arrays, with
+# the weights alpha and beta chosen to minimise the variance of X_w (see
+# variance_surfaces.py). Grids are cached, so redrawing in the same session is free.
+surfaces = variance_grid(E, K)
+X_c = surfaces['X_c']
+X_t = surfaces['X_t']
+X_bar = surfaces['X_bar']
+X_w = surfaces['X_w']
 
 K_grid, E_grid = np.meshgrid(K, E)
 
@@ -0,0 +1,100 @@
+'''
+ORDER STATISTICS
+
+A summary of the order statistics of a data set, shared by the estimators which need
+several of them (the median and quartiles of the Winsorization bounds, the median of the
+MAD, the cut points of a trimmed mean). All the order statistics asked for are found
+together by one np.partition of a copy of the data with every rank needed as a kth, and
+are cached, so asking for the median, quartiles and bounds costs one selection pass instead
+of one sort or partition each. Clipping is done with np.clip.
+
+Quantiles are interpolated linearly between order statistics, as np.percentile does, and
+the median averages the two middle values, as np.median does.
+
+'''
+
+
+import numpy as np
+
+
+class QuantileSummary:
+
+    # probs are the quantiles to find straight away, in the first partition
+    def __init__(self, data, probs=(0.25, 0.5, 0.75)):
+        self.data = np.asarray(data, dtype=float).ravel()
+        self.n = len(self.data)
+        if self.n == 0:
+            raise ValueError('QuantileSummary needs at least one point')
+        self._partitioned = self.data.copy()
+        self._kth = set()
+        self.prefetch(probs)
+
+    # This function returns the two ranks (0-based) a quantile is interpolated
+    # between, and the interpolation weight
+    def _ranks(self, q):
+        if not 0 <= q <= 1:
+            raise ValueError(f'quantiles must be in [0, 1], got {q}')
+        position = q * (self.n - 1)
+        lo = int(np.floor(position))
+        return lo, min(lo + 1, self.n - 1), position - lo
+
+    # This function makes sure the given ranks are in place in the partitioned
+    # copy. The partition is redone with every rank asked for so far, so all of
+    # them stay valid.
+    def _select(self, ranks):
+        ranks = set(ranks)
+        if not ranks <= self._kth:
+            self._kth |= ranks
+            self._partitioned.partition(sorted(self._kth))
+
+    # This function finds the order statistics of all the quantiles probs in
+    # one partition, so that reading them later costs nothing
+    def prefetch(self, probs):
+        self._select(rank for q in probs for rank in self._ranks(q)[:2])
+        return self
+
+    # This function returns the order statistic of (0-based) rank k
+    def order_statistic(self, k):
+        self._select([k])
+        return self._partitioned[k]
+
+    def quantile(self, q):
+        lo, hi, t = self._ranks(q)
+        self._select([lo, hi])
+        a, b = self._partitioned[lo], self._partitioned[hi]
+        return b - (b - a) * (1 - t) if t >= 0.5 else a + (b - a) * t
+
+    def median(self):
+        lo, hi = (self.n - 1) // 2, self.n // 2
+        self._select([lo, hi])
+        return (self._partitioned[lo] + self._partitioned[hi]) / 2
+
+    def iqr(self):
+        return self.quantile(0.75) - self.quantile(0.25)
+
+    # This function returns the Winsorization bounds, the median plus or minus
+    # scale times the IQR
+    def bounds(self, scale):
+        median = self.median()
+        iqr = self.iqr()
+        return median - scale * iqr, median + scale * iqr
+
+    # This function returns a copy of the data clipped to the bounds
+    def winsorize(self, scale):
+        return np.clip(self.data, *self.bounds(scale))
+
+    # This function returns the unnormalised MAD, the median of the distances
+    # from the data to its median
+    def mad(self):
+        return QuantileSummary(np.abs(self.data - self.median()), probs=()).median()
+
+    # This function returns the mean of the data left after cutting
+    # int(proportion * n) points off each end (as scipy.stats.trim_mean)
+    def trimmed_mean(self, proportion):
+        if not 0 <= proportion < 0.5:
+            raise ValueError(f'proportion must be in [0, 0.5), got {proportion}')
+        cut = int(proportion * self.n)
+        if cut == 0:
+            return np.mean(self.data)
+        self._select([cut, self.n - cut - 1])
+        return np.mean(self._partitioned[cut:self.n - cut])
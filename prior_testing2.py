@@ -22,33 +22,91 @@ import matplotlib.pyplot as plt
 import arviz as az
 import scipy.stats as stats
 
+from trace_cache import TraceCache, model_spec
+from sequential_update import update_posterior, loglik_function, log_posterior_function
+from fast_inference import fit
+
+# The seeds for the data and the sampler are fixed, so that the traces can be
+# reused from the cache (see trace_cache.py) when nothing has changed
+DATA_SEED = 0
+SAMPLER_SEED = 1
+cache = TraceCache('trace_cache')
+
+# The inference backend: 'nuts' for the figure, or 'laplace' or 'advi' for a
+# quick screen of the priors, which prints an accuracy report against a small
+# NUTS reference for each model (see fast_inference.py)
+BACKEND = 'nuts'
+
+
+# This function samples the current model with pm.sample(**settings), or
+# returns the cached trace for the same data, model and settings. The key is
+# derived from the model itself (see model_spec in trace_cache.py), so an
+# edited model is always sampled again. With a fast BACKEND the model is
+# approximated instead, and nothing is cached.
+def cached_sample(data, **settings):
+    settings = {'random_seed': SAMPLER_SEED, **settings}
+    if BACKEND != 'nuts':
+        result = fit(backend=BACKEND, draws=settings['draws'], seed=SAMPLER_SEED)
+        print(result.report)
+        return result.trace
+    return cache.sample(data, model_spec(), settings, lambda: pm.sample(**settings))
+
+
+# Set to True to get the posteriors for data2 by updating those for data1 with
+# the extra point (see sequential_update.py), instead of sampling again
+SEQUENTIAL = False
+
+
+# This function returns the posterior for data (data1 plus extra points),
+# either updated from trace1, the posterior for data1, or sampled as usual
+def updated_sample(trace1, data, prior, **settings):
+    if not SEQUENTIAL:
+        return cached_sample(data, **settings)
+    return update_posterior(trace1, loglik_function(data[len(data1):], 'normal', LIKELIHOOD_SIGMA),
+                            log_posterior_function(data, prior, 'normal', LIKELIHOOD_SIGMA),
+                            seed=SAMPLER_SEED).trace
+
+
 # Generate both data sets
-data1 = np.random.normal(loc=-0.5, scale=2, size=30)
+rng = np.random.default_rng(DATA_SEED)
+data1 = rng.normal(loc=-0.5, scale=2, size=30)
 data2 = np.concatenate((data1, [20]))
 
 mu_prior_mean = 0  # Prior mean
 mu_prior_sigma = 2  # Prior standard deviation
 
+# The two priors for mu and the known sigma of the normal likelihood, used both
+# to build the models and for the sequential update
+PRIORS = {'normal': {'family': 'normal', 'mu': mu_prior_mean, 'sigma': 0.5},
+          't': {'family': 't', 'nu': 3, 'mu': mu_prior_mean, 'sigma': 0.289}}
+LIKELIHOOD_SIGMA = 2
+
+
+# This function adds the prior for mu to the current model and returns it
+def prior_variable(prior):
+    if prior['family'] == 't':
+        return pm.StudentT("mu", nu=prior['nu'], mu=prior['mu'], sigma=prior['sigma'])
+    return pm.Normal("mu", mu=prior['mu'], sigma=prior['sigma'])
+
+
 # Normal prior example
 with pm.Model() as model1_normal:
     # Normal prior for the unknown mean
-    mu_prior = pm.Normal("mu", mu=mu_prior_mean, sigma=0.5)
-    sigma_prior = 2
+    mu_prior = prior_variable(PRIORS['normal'])
 
     # Likelihood for the first dataset
-    likelihood1 = pm.Normal("y1", mu=mu_prior, sigma=sigma_prior, observed=data1)
+    likelihood1 = pm.Normal("y1", mu=mu_prior, sigma=LIKELIHOOD_SIGMA, observed=data1)
 
     # Perform inference on the first dataset
-    trace1_normal = pm.sample(1000, cores=1)
+    trace1_normal = cached_sample(data1, draws=1000, cores=1)
 
 
 
 # Second model with the same prior but update with the second dataset
 with pm.Model() as model2_normal:
-    mu_prior = pm.Normal("mu", mu=mu_prior_mean, sigma=0.5)
-    sigma_prior = 2
-    likelihood2 = pm.Normal("y2", mu=mu_prior, sigma=sigma_prior, observed=data2)
-    trace2_normal = pm.sample(1000, cores=1)
+    mu_prior = prior_variable(PRIORS['normal'])
+    likelihood2 = pm.Normal("y2", mu=mu_prior, sigma=LIKELIHOOD_SIGMA, observed=data2)
+    trace2_normal = updated_sample(trace1_normal, data2, PRIORS['normal'], draws=1000, cores=1)
 
 
 
@@ -60,23 +118,19 @@ with pm.Model() as model2_normal:
 
 # Student's t-distribution prior example
 with pm.Model() as model1_t:
-    mu_prior = pm.StudentT("mu", nu=3, mu=mu_prior_mean, sigma=0.289)
-
-    sigma_prior = 2
+    mu_prior = prior_variable(PRIORS['t'])
 
     # Likelihood for the first dataset
-    likelihood1_t = pm.Normal("y1", mu=mu_prior, sigma=sigma_prior, observed=data1)
+    likelihood1_t = pm.Normal("y1", mu=mu_prior, sigma=LIKELIHOOD_SIGMA, observed=data1)
 
     # Perform inference on the first dataset
-    trace1_t = pm.sample(5000, cores=1, tune=2000)
+    trace1_t = cached_sample(data1, draws=5000, cores=1, tune=2000)
 
 # Second model with the same t-distribution prior but update with the second dataset
 with pm.Model() as model2_t:
-    mu_prior = pm.StudentT("mu", nu=3, mu=mu_prior_mean, sigma=0.289)
-
-    sigma_prior = 2
-    likelihood2_t = pm.Normal("y2", mu=mu_prior, sigma=sigma_prior, observed=data2)
-    trace2_t = pm.sample(5000, cores=1, tune=2000)
+    mu_prior = prior_variable(PRIORS['t'])
+    likelihood2_t = pm.Normal("y2", mu=mu_prior, sigma=LIKELIHOOD_SIGMA, observed=data2)
+    trace2_t = updated_sample(trace1_t, data2, PRIORS['t'], draws=5000, cores=1, tune=2000)
 
 # Plotting both models: Normal and Student's t Prior
 fig, axs = plt.subplots(1, 2, figsize=(12, 6))
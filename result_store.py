@@ -0,0 +1,106 @@
+'''
+RESULT STORE
+
+A store on disk for the results of long simulation sweeps (the Table 2.1 study in
+scale_study.py and the MCD study in mcd_simulation.py). Every cell of a sweep is keyed by
+(estimator, scenario, n, p, contamination, seed), plus any extra fields a sweep needs, and
+its values are written to their own NPZ (or Parquet) file as soon as the cell is finished.
+When a sweep is restarted it skips the cells which are already in the store, and when a new
+estimator is added only that estimator's cells are missing, so only those are computed.
+
+Files are written to a temporary name and then renamed, so a crash never leaves a half
+written cell behind.
+
+'''
+
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+# The fields every cell key must have
+CELL_FIELDS = ('estimator', 'scenario', 'n', 'p', 'contamination', 'seed')
+
+
+# This function turns a cell key into a plain dict with JSON-friendly values,
+# checking that it has all of CELL_FIELDS
+def _canonical(key):
+    key = dict(key)
+    missing = [field for field in CELL_FIELDS if field not in key]
+    if missing:
+        raise KeyError(f'cell key is missing {missing}')
+    return {field: value.item() if isinstance(value, np.generic) else value
+            for field, value in key.items()}
+
+
+class ResultStore:
+
+    def __init__(self, directory, format='npz'):
+        if format not in ('npz', 'parquet'):
+            raise ValueError(f"format must be 'npz' or 'parquet', got {format!r}")
+        self.directory = directory
+        self.format = format
+        os.makedirs(directory, exist_ok=True)
+
+    # This function returns the file of a cell, named by a hash of its key
+    def path(self, key):
+        text = json.dumps(_canonical(key), sort_keys=True)
+        name = hashlib.sha1(text.encode()).hexdigest()[:24]
+        return os.path.join(self.directory, f'{name}.{self.format}')
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    # This function returns the keys of the cells which are not in the store
+    def missing(self, keys):
+        return [key for key in keys if key not in self]
+
+    def get(self, key):
+        path = self.path(key)
+        if self.format == 'npz':
+            with np.load(path) as f:
+                return f['values']
+        return pd.read_parquet(path)['values'].to_numpy()
+
+    def put(self, key, values):
+        key = _canonical(key)
+        values = np.asarray(values).ravel()
+        path = self.path(key)
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if self.format == 'npz':
+                    np.savez(f, values=values, key=json.dumps(key, sort_keys=True))
+                else:
+                    frame = pd.DataFrame({'values': values})
+                    frame.attrs['key'] = json.dumps(key, sort_keys=True)
+                    frame.to_parquet(f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    # This function returns every cell in the store as a DataFrame with one row
+    # per cell: the key fields, and the cell's values as an array
+    def to_frame(self):
+        rows = []
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith('.' + self.format):
+                continue
+            path = os.path.join(self.directory, name)
+            if self.format == 'npz':
+                with np.load(path) as f:
+                    key = json.loads(str(f['key']))
+                    values = f['values']
+            else:
+                frame = pd.read_parquet(path)
+                key = json.loads(frame.attrs['key'])
+                values = frame['values'].to_numpy()
+            rows.append({**key, 'values': values})
+        return pd.DataFrame(rows)
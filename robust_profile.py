@@ -0,0 +1,97 @@
+'''
+ROBUST PROFILE
+
+In this code we produce the Table 2.2 summary (mean, median and IQR-Winsorized mean, as in
+weather_simulation.py) together with the MAD and Q_n, for every numeric column of a weather
+station log at once, instead of only the temperature field. The log is read a single time
+into columnar day means by the daily index (see daily_index.py), and the columns are then
+summarised in parallel on a thread pool. The median, quartiles and MAD of each column come
+from one QuantileSummary (see order_stats.py).
+
+Extra points can be appended to any column before it is summarised, e.g. the heatwave
+temperatures of weather_simulation.py, to see how each estimator reacts to them.
+
+'''
+
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from SD_estimaors_repeat import Q_n
+from order_stats import QuantileSummary
+
+
+# The statistics reported for each column, in order
+STATISTICS = ('mean', 'median', 'winsorized_mean', 'MAD', 'Q_n')
+
+
+# This function returns the statistics of one column, ignoring missing values.
+# The Winsorized mean clips the column at its median plus or minus scale times
+# its IQR, as winsorize in weather_simulation.py does, and the MAD is
+# unnormalised, as MAD in SD_estimaors_repeat.py.
+def _profile_column(column, scale, k):
+    y = np.asarray(column, dtype=float)
+    y = y[~np.isnan(y)]
+    if len(y) == 0:
+        return dict.fromkeys(STATISTICS, np.nan)
+
+    summary = QuantileSummary(y)
+    return {
+        'mean': np.mean(y),
+        'median': summary.median(),
+        'winsorized_mean': np.mean(summary.winsorize(scale)),
+        'MAD': summary.mad(),
+        'Q_n': Q_n(y, k) if len(y) > 1 else np.nan,
+    }
+
+
+# This function returns the statistics of every column as a DataFrame with one
+# row per column. The data is either a (rows x columns) array, with the column
+# names given by names, or a dict of name -> 1-D array (whose lengths may
+# differ). The columns are spread over a pool of n_workers threads.
+def profile(data, names=None, scale=1.7, k=0.25, n_workers=None):
+    if isinstance(data, dict):
+        names, columns = list(data), list(data.values())
+    else:
+        data = np.asarray(data, dtype=float)
+        if data.ndim != 2:
+            raise ValueError(f'data must be 2-D, got shape {data.shape}')
+        names = list(range(data.shape[1])) if names is None else list(names)
+        if len(names) != data.shape[1]:
+            raise ValueError(f'got {len(names)} names for {data.shape[1]} columns')
+        columns = list(data.T)
+
+    with ThreadPoolExecutor(n_workers) as pool:
+        rows = list(pool.map(lambda column: _profile_column(column, scale, k), columns))
+
+    return pd.DataFrame(rows, index=pd.Index(names, name='column'), columns=list(STATISTICS))
+
+
+# This function returns the profile of the day means of every column of a log,
+# read through its daily index. extra is an optional dict of column name ->
+# points to append to that column's day means before it is summarised.
+def profile_log(path, extra=None, scale=1.7, k=0.25, n_workers=None, index_path=None):
+    from daily_index import DailyIndex
+
+    daily = DailyIndex.open(path, index_path)
+    columns = {name: daily.mean[:, j] for j, name in enumerate(daily.columns)}
+    for name, points in (extra or {}).items():
+        columns[name] = np.concatenate([columns[name], np.asarray(points, dtype=float)])
+
+    return profile(columns, scale=scale, k=k, n_workers=n_workers)
+
+
+if __name__ == '__main__':
+    path = "C:\\Users\\gabri\\Downloads\\JCMB_2012.csv"
+
+    # The heatwave temperatures added in weather_simulation.py
+    heatwave = [31, 27, 24, 25, 29, 31, 37, 40]
+
+    regular = profile_log(path)
+    print('REGULAR')
+    print(regular.to_string())
+
+    print('HEATWAVE ADDED')
+    print(profile_log(path, extra={regular.index[4]: heatwave}).to_string())
@@ -0,0 +1,243 @@
+'''
+ROBUST REGRESSION
+
+In this code we fit linear regressions with the Huber and Tukey losses of Figure 2.4 to
+tables which are too big to hold in memory. The fit is by iteratively reweighted least
+squares: every iteration streams the rows through in chunks, and each chunk only adds its
+contribution to X^T W X and X^T W y, so the memory used depends on p^2 and the chunk size,
+not on the number of rows. Runs of chunks are spread over a process (or thread) pool and
+their partial sums are added together.
+
+The scale of the residuals is their normalised MAD, read off the OnlineMAD sketch of
+streaming_estimators.py which is filled in during the same pass. So each iteration needs
+only one pass over the data, the weights use the scale from the pass before (the first
+pass is an ordinary least squares fit). The Tukey fit starts from the converged Huber fit,
+and keeps its scale fixed.
+
+The rows come from a list of chunk descriptions, made by one of:
+    array_chunks(X, y)                in-memory arrays, or paths to .npy files (memory-mapped)
+    npz_chunks(paths)                 NPZ files each holding the arrays X and y
+    parquet_chunks(paths, features, response)   Parquet files, one chunk per row group
+
+'''
+
+
+import os
+from collections import namedtuple
+from functools import partial
+from statistics import NormalDist
+
+import numpy as np
+
+from bootstrap import map_tasks
+from loss_kernels import LOSSES
+from m_estimators import TUNING
+from streaming_estimators import OnlineMAD
+
+
+# The number of rows per chunk for array_chunks, if not given
+CHUNK_ROWS = 2 ** 16
+
+# The factor making the MAD a consistent estimator of the SD for normal data
+_MAD_TO_SD = 1 / NormalDist().inv_cdf(0.75)
+
+RegressionResult = namedtuple('RegressionResult', ['coef', 'intercept', 'scale', 'n_iter', 'converged'])
+
+
+###############################################################
+####################### Chunk sources #########################
+###############################################################
+
+# This function returns the chunks of rows of X and y. Either may be an array
+# (including a memory map), of which each chunk holds only its own rows, or
+# the path of a .npy file, which each worker opens memory-mapped. Array chunks
+# are copied to the workers of a process pool on every pass, so robust_regression
+# uses threads for them unless told otherwise.
+def array_chunks(X, y, chunk_rows=CHUNK_ROWS):
+    n = len(np.load(y, mmap_mode='r')) if isinstance(y, (str, os.PathLike)) else len(y)
+
+    def rows(a, start, stop):
+        return a if _is_path(a) else a[start:stop]
+
+    return [('array', rows(X, start, stop), rows(y, start, stop), start, stop)
+            for start, stop in ((start, min(start + chunk_rows, n)) for start in range(0, n, chunk_rows))]
+
+
+# This function returns one chunk per NPZ file, each holding the arrays X and y
+def npz_chunks(paths):
+    return [('npz', path) for path in paths]
+
+
+# This function returns one chunk per row group of the Parquet files, using
+# the columns features as X and the column response as y. It needs pyarrow.
+def parquet_chunks(paths, features, response):
+    import pyarrow.parquet as pq
+
+    return [('parquet', path, group, list(features), response)
+            for path in paths for group in range(pq.ParquetFile(path).num_row_groups)]
+
+
+def _is_path(a):
+    return isinstance(a, (str, os.PathLike))
+
+
+# This function returns True if the chunk holds its rows in memory, rather
+# than reading them from a file
+def _in_memory(chunk):
+    return chunk[0] == 'array' and not (_is_path(chunk[1]) or _is_path(chunk[2]))
+
+
+# This function reads a chunk, returning X as a 2-D float array and y
+def _load_chunk(chunk):
+    kind = chunk[0]
+    if kind == 'array':
+        _, X, y, start, stop = chunk
+        if _is_path(X):
+            X = np.load(X, mmap_mode='r')[start:stop]
+        if _is_path(y):
+            y = np.load(y, mmap_mode='r')[start:stop]
+    elif kind == 'npz':
+        with np.load(chunk[1]) as f:
+            X, y = f['X'], f['y']
+    elif kind == 'parquet':
+        import pyarrow.parquet as pq
+
+        _, path, group, features, response = chunk
+        table = pq.ParquetFile(path).read_row_group(group, columns=features + [response])
+        X = np.column_stack([table.column(name).to_numpy() for name in features])
+        y = table.column(response).to_numpy()
+    else:
+        raise ValueError(f'unknown chunk kind {kind!r}')
+
+    X = np.asarray(X, dtype=float)
+    return X.reshape(len(X), -1), np.asarray(y, dtype=float).ravel()
+
+
+###############################################################
+######################### IRLS pass ###########################
+###############################################################
+
+# This function makes one pass over a run of chunks, returning X^T W X, X^T W y
+# and an OnlineMAD sketch of the residuals y - X beta. With scale None every
+# weight is 1 (least squares), and with beta None no residuals are sketched.
+def _irls_pass(chunks, beta, scale, loss, c, fit_intercept, relative_accuracy):
+    XtWX = XtWy = None
+    mad = OnlineMAD(relative_accuracy)
+
+    for chunk in chunks:
+        X, y = _load_chunk(chunk)
+        if fit_intercept:
+            X = np.column_stack([X, np.ones(len(X))])
+        if XtWX is None:
+            XtWX = np.zeros((X.shape[1], X.shape[1]))
+            XtWy = np.zeros(X.shape[1])
+
+        if beta is None:
+            w = np.ones(len(y))
+        else:
+            r = y - X @ beta
+            mad.update(r)
+            w = np.ones(len(y)) if scale is None else LOSSES[loss].weight(r / scale, c)
+
+        Xw = X * w[:, None]
+        XtWX += Xw.T @ X
+        XtWy += Xw.T @ y
+
+    return XtWX, XtWy, mad
+
+
+# This function runs one pass over all the chunks on the pool, adding up the
+# partial sums. Each task is a run of consecutive chunks, a few per worker.
+def _full_pass(chunks, beta, scale, loss, c, fit_intercept, relative_accuracy, n_workers, executor):
+    n_tasks = min(len(chunks), 4 * n_workers) if n_workers > 1 else 1
+    runs = [list(run) for run in np.array_split(np.arange(len(chunks)), n_tasks)]
+    runs = [[chunks[i] for i in run] for run in runs if run]
+
+    func = partial(_irls_pass, beta=beta, scale=scale, loss=loss, c=c,
+                   fit_intercept=fit_intercept, relative_accuracy=relative_accuracy)
+    parts = map_tasks(func, runs, n_workers, executor)
+
+    XtWX = sum(part[0] for part in parts if part[0] is not None)
+    XtWy = sum(part[1] for part in parts if part[1] is not None)
+    mad = parts[0][2]
+    for part in parts[1:]:
+        mad.merge(part[2])
+    return XtWX, XtWy, mad
+
+
+# This function solves the weighted normal equations, falling back to least
+# squares if they are singular (e.g. Tukey weights of zero for whole columns)
+def _solve(XtWX, XtWy):
+    try:
+        return np.linalg.solve(XtWX, XtWy)
+    except np.linalg.LinAlgError:
+        return np.linalg.lstsq(XtWX, XtWy, rcond=None)[0]
+
+
+###############################################################
+#################### Define functions #########################
+###############################################################
+
+# This function fits the linear regression of y on X with the 'huber' or
+# 'tukey' loss (tuning constant c), streaming the chunks once per iteration.
+# The fit has converged when an iteration changes no coefficient by more than
+# tol times the scale (and, for Huber, the scale by more than tol times
+# itself). The coefficients for X are returned as coef, and the intercept (if
+# fit_intercept) separately. By default the passes run on a thread pool when
+# every chunk is held in memory (the matrix products release the GIL), and on
+# a process pool when the chunks are read from files.
+def robust_regression(chunks, loss='huber', c=None, fit_intercept=True, tol=1e-6, max_iter=50,
+                      n_workers=None, executor=None, relative_accuracy=0.01):
+    if loss not in TUNING:
+        raise ValueError(f'loss must be one of {sorted(TUNING)}, got {loss!r}')
+    if executor is None:
+        executor = 'thread' if all(_in_memory(chunk) for chunk in chunks) else 'process'
+    if executor not in ('thread', 'process'):
+        raise ValueError(f"executor must be 'thread' or 'process', got {executor!r}")
+    if not chunks:
+        raise ValueError('no chunks to fit')
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    run_pass = partial(_full_pass, chunks, fit_intercept=fit_intercept,
+                       relative_accuracy=relative_accuracy, n_workers=n_workers, executor=executor)
+
+    # Least squares start, which also gives the residuals for the first scale
+    beta = _solve(*run_pass(None, None, loss, None)[:2])
+    scale = None
+    n_iter = 0
+
+    # Tukey's loss is not convex, so it starts from the Huber fit
+    stages = [('huber', TUNING['huber'] if loss == 'tukey' else c)]
+    if loss == 'tukey':
+        stages.append(('tukey', c))
+
+    for stage_loss, stage_c in stages:
+        stage_c = TUNING[stage_loss] if stage_c is None else stage_c
+        update_scale = stage_loss == 'huber'
+        converged = False
+
+        while n_iter < max_iter:
+            XtWX, XtWy, mad = run_pass(beta, scale, stage_loss, stage_c)
+            n_iter += 1
+            new_scale = _MAD_TO_SD * mad.result() if update_scale or scale is None else scale
+            if new_scale == 0:
+                scale = new_scale
+                converged = True
+                break
+
+            new_beta = _solve(XtWX, XtWy) if scale is not None else beta
+            converged = (scale is not None and np.max(np.abs(new_beta - beta)) <= tol * new_scale
+                         and abs(new_scale - scale) <= tol * new_scale)
+            beta, scale = new_beta, new_scale
+            if converged:
+                break
+
+        # An exact fit of over half the rows leaves no scale to weight by, so
+        # there is nothing for a later stage to do
+        if scale == 0:
+            break
+
+    if fit_intercept:
+        return RegressionResult(beta[:-1], beta[-1], scale, n_iter, converged)
+    return RegressionResult(beta, 0.0, scale, n_iter, converged)
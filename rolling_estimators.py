@@ -0,0 +1,297 @@
+'''
+ROLLING ESTIMATORS
+
+In this code we compute robust location and scale statistics over a moving window of a
+time series (e.g. the last 96 readings of the 15 minute JCMB temperature data used in
+weather_simulation.py): the median, IQR, MAD and the mean of the data Winsorized at the
+median plus or minus scale * IQR.
+
+The window is kept in an indexable skiplist, whose links also store the number and sum of
+the values they skip over. The sums are kept exactly, as integer multiples of the smallest
+positive float, so a huge outlier passing through the window never costs the Winsorized
+mean any precision. Adding or removing a reading, finding an order statistic, or
+finding how many of the values (and their sum) lie below a bound all cost O(log w) for a
+window of w readings, so the median, IQR and Winsorized mean cost O(log w) per time step,
+and the MAD O(log(w)^2), rather than re-sorting the window every step.
+
+'''
+
+
+import random
+from collections import deque
+from math import log2
+
+import numpy as np
+
+
+###############################################################
+################### Indexable skiplist ########################
+###############################################################
+
+# Every finite float is an integer multiple of 2 ** -1074, so sums kept as these
+# integers are exact, and dividing by _UNIT rounds them correctly to a float
+_UNIT = 2 ** 1074
+
+
+# This function returns the finite float x as an integer multiple of 1 / _UNIT
+def _exact(x):
+    numerator, denominator = x.as_integer_ratio()
+    return numerator * (_UNIT // denominator)
+
+
+# A node of the skiplist. next[l] is the following node on level l (None at the
+# end), width[l] the number of places that link moves forward, and total[l] the
+# exact sum (see _exact) of the values it moves over (including the value it
+# lands on).
+class _Node:
+    __slots__ = ('value', 'next', 'width', 'total')
+
+    def __init__(self, value, levels):
+        self.value = value
+        self.next = [None] * levels
+        self.width = [1] * levels
+        self.total = [0] * levels
+
+
+# A sorted multiset of floats with O(log n) insert, remove, access by position,
+# and count and sum of the values below a bound
+class IndexableSkiplist:
+
+    def __init__(self, expected_size=100, seed=None):
+        self.size = 0
+        self.levels = int(1 + log2(max(expected_size, 2)))
+        self.head = _Node(-np.inf, self.levels)
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return self.size
+
+    # This function returns the value at (0-based) position i
+    def __getitem__(self, i):
+        if not 0 <= i < self.size:
+            raise IndexError('skiplist index out of range')
+        node = self.head
+        i += 1
+        for level in reversed(range(self.levels)):
+            while node.next[level] is not None and node.width[level] <= i:
+                i -= node.width[level]
+                node = node.next[level]
+        return node.value
+
+    def insert(self, value):
+        chain, position, total = self._search(value, strict=False)
+        exact = _exact(value)
+        levels = min(self.levels, 1 + int(log2(1 / (1 - self._random.random()))))
+        node = _Node(value, levels)
+
+        for level in range(self.levels):
+            before = chain[level]
+            if level < levels:
+                # Split the link from before into before -> node -> old next
+                moved = position[0] - position[level]
+                moved_total = total[0] - total[level]
+                node.next[level] = before.next[level]
+                node.width[level] = before.width[level] - moved
+                node.total[level] = before.total[level] - moved_total
+                before.next[level] = node
+                before.width[level] = moved + 1
+                before.total[level] = moved_total + exact
+            else:
+                before.width[level] += 1
+                before.total[level] += exact
+
+        self.size += 1
+
+    def remove(self, value):
+        chain, _, _ = self._search(value, strict=True)
+        node = chain[0].next[0]
+        if node is None or node.value != value:
+            raise KeyError(value)
+        exact = _exact(value)
+
+        for level in range(self.levels):
+            before = chain[level]
+            if level < len(node.next):
+                before.width[level] += node.width[level] - 1
+                before.total[level] += node.total[level] - exact
+                before.next[level] = node.next[level]
+            else:
+                before.width[level] -= 1
+                before.total[level] -= exact
+
+        self.size -= 1
+
+    # This function returns how many values are below x (at most x if not
+    # strict) and their exact sum, as a multiple of 1 / _UNIT
+    def count_and_sum_below(self, x, strict=True):
+        _, position, total = self._search(x, strict)
+        return position[0], total[0]
+
+    # This function walks down the levels to just before x, returning the last
+    # node on each level before x, with its position and the sum of the values
+    # up to it
+    def _search(self, x, strict):
+        chain = [None] * self.levels
+        position = [0] * self.levels
+        total = [0] * self.levels
+        node = self.head
+        pos = 0
+        acc = 0
+        for level in reversed(range(self.levels)):
+            while True:
+                nxt = node.next[level]
+                if nxt is None or (nxt.value >= x if strict else nxt.value > x):
+                    break
+                pos += node.width[level]
+                acc += node.total[level]
+                node = nxt
+            chain[level] = node
+            position[level] = pos
+            total[level] = acc
+        return chain, position, total
+
+
+###############################################################
+###################### Rolling window #########################
+###############################################################
+
+# This function interpolates between a and b as np.percentile does
+def _lerp(a, b, t):
+    diff = b - a
+    return b - diff * (1 - t) if t >= 0.5 else a + diff * t
+
+
+# A window holding the last `window` values pushed into it, with the robust
+# statistics of its contents
+class RollingWindow:
+
+    def __init__(self, window, seed=None):
+        if window < 1:
+            raise ValueError(f'window must be at least 1, got {window}')
+        self.window = window
+        self.values = deque()
+        self.sorted = IndexableSkiplist(window, seed)
+
+    def __len__(self):
+        return len(self.values)
+
+    # This function adds a value, dropping the oldest one once the window is full
+    def push(self, x):
+        x = float(x)
+        if not np.isfinite(x):
+            raise ValueError('rolling estimators do not accept NaN or infinite values')
+        self.values.append(x)
+        self.sorted.insert(x)
+        if len(self.values) > self.window:
+            self.sorted.remove(self.values.popleft())
+
+    # This function returns the q-quantile of the window, interpolating linearly
+    # as np.percentile does
+    def quantile(self, q):
+        pos = q * (len(self) - 1)
+        lo = int(pos)
+        hi = min(lo + 1, len(self) - 1)
+        return _lerp(self.sorted[lo], self.sorted[hi], pos - lo)
+
+    def median(self):
+        n = len(self)
+        return (self.sorted[(n - 1) // 2] + self.sorted[n // 2]) / 2
+
+    def iqr(self):
+        return self.quantile(0.75) - self.quantile(0.25)
+
+    # This function returns the (unnormalised) MAD of the window
+    def mad(self):
+        n = len(self)
+        m = self.median()
+        return (self._kth_distance(m, (n - 1) // 2 + 1) + self._kth_distance(m, n // 2 + 1)) / 2
+
+    # This function returns the mean of the window after Winsorizing it at the
+    # median plus or minus scale * IQR (as winsorize in weather_simulation.py).
+    # The sum of the values between the bounds is the exact difference of two
+    # prefix sums, so the clipped outliers do not cancel out its precision.
+    def winsorized_mean(self, scale):
+        n = len(self)
+        m = self.median()
+        iqr = self.iqr()
+        cminus = m - scale * iqr
+        cplus = m + scale * iqr
+
+        n_below, sum_below = self.sorted.count_and_sum_below(cminus, strict=True)
+        n_upto, sum_upto = self.sorted.count_and_sum_below(cplus, strict=False)
+
+        return (cminus * n_below + (sum_upto - sum_below) / _UNIT + cplus * (n - n_upto)) / n
+
+    # This function returns the k-th smallest (1-based) distance from m to the
+    # values in the window. The k closest values are a block of k consecutive
+    # sorted values, and the best block is the first one whose right end is at
+    # least as far from m as its left end, which is found by bisection.
+    def _kth_distance(self, m, k):
+        s = self.sorted
+        lo, hi = 0, len(self) - k + 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if m - s[mid] <= s[mid + k - 1] - m:
+                hi = mid
+            else:
+                lo = mid + 1
+
+        dist = np.inf
+        if lo <= len(self) - k:
+            dist = s[lo + k - 1] - m
+        if lo > 0:
+            dist = min(dist, m - s[lo - 1])
+        return abs(dist)
+
+
+###############################################################
+#################### Rolling functions ########################
+###############################################################
+
+# This function returns the rolling median, IQR, MAD and Winsorized mean of the
+# series x over a window of the given length, in one pass. Each output has the
+# same length as x, with NaN until the first window is full.
+def rolling_summary(x, window, scale=1.7):
+    x = np.asarray(x, dtype=float)
+    out = {name: np.full(len(x), np.nan) for name in ('median', 'iqr', 'mad', 'winsorized_mean')}
+
+    w = RollingWindow(window)
+    for t, value in enumerate(x):
+        w.push(value)
+        if len(w) == window:
+            out['median'][t] = w.median()
+            out['iqr'][t] = w.iqr()
+            out['mad'][t] = w.mad()
+            out['winsorized_mean'][t] = w.winsorized_mean(scale)
+
+    return out
+
+
+# This function applies one statistic of RollingWindow over the series x
+def _rolling(x, window, statistic):
+    x = np.asarray(x, dtype=float)
+    out = np.full(len(x), np.nan)
+
+    w = RollingWindow(window)
+    for t, value in enumerate(x):
+        w.push(value)
+        if len(w) == window:
+            out[t] = statistic(w)
+
+    return out
+
+
+def rolling_median(x, window):
+    return _rolling(x, window, RollingWindow.median)
+
+
+def rolling_iqr(x, window):
+    return _rolling(x, window, RollingWindow.iqr)
+
+
+def rolling_mad(x, window):
+    return _rolling(x, window, RollingWindow.mad)
+
+
+def rolling_winsorized_mean(x, window, scale=1.7):
+    return _rolling(x, window, lambda w: w.winsorized_mean(scale))
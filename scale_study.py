@@ -0,0 +1,170 @@
+'''
+TABLE 2.1 RUNNER
+
+In this code we run the Monte Carlo study behind Table 2.1. Each replication draws a
+'pure' N(0,1) sample and the three corrupted versions of it, and applies every scale
+estimator from SD_estimaors_repeat.py to all four. Replications are split into fixed-size
+blocks which are spread over a process pool. Every replication gets its own random stream
+spawned from one SeedSequence, and the blocks do not depend on the number of workers, so
+the results are bit-identical however many workers are used. Finished blocks can be saved
+to a ResultStore (result_store.py), so that an interrupted run can be resumed.
+
+'''
+
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from batched_estimators import (batched_empirical_SD, batched_abs_dev, batched_MAD,
+                                batched_Winsorize_bad, batched_S_n, batched_Q_n)
+
+
+# The estimators in the rows of the table, in order. Each is applied to a
+# (replications x n) array of samples, with the Winsorizing constant c and the
+# Q_n parameter k. A new estimator only needs an entry here.
+ESTIMATORS = {
+    'Sample standard deviation': lambda samples, c, k: batched_empirical_SD(samples),
+    'Absolute deviation': lambda samples, c, k: batched_abs_dev(samples),
+    'MAD': lambda samples, c, k: batched_MAD(samples),
+    'Winsor shift': lambda samples, c, k: batched_Winsorize_bad(samples, c),
+    'S_n': lambda samples, c, k: batched_S_n(samples),
+    'Q_n': lambda samples, c, k: batched_Q_n(samples, k),
+}
+
+# The data sets in the columns of the table, and the number of corrupt points
+# added to the original sample in each
+SCENARIOS = ['Data A', 'Data B', 'Data C', 'Data D']
+EXTRA_POINTS = [0, 1, 10, 50]
+
+
+###############################################################
+#################### Define functions #########################
+###############################################################
+
+# This function generates the four data sets for one replication: the original
+# n points from a N(0,1), the same with an additional value at 10,000, with 10
+# extra points from a N(0,9), and with 50 extra points at 0
+def make_scenarios(rng, n=200):
+    data_use = rng.normal(size=n)
+    return [
+        data_use,
+        np.concatenate((data_use, [10000])),
+        np.concatenate((data_use, rng.normal(size=10, scale=9))),
+        np.concatenate((data_use, [0] * 50)),
+    ]
+
+
+# This function applies the named estimators (all of them by default) to a
+# (replications x n) array of samples, returning a (replications x estimators)
+# array
+def apply_estimators(samples, c=1.7, k=0.25, names=None):
+    names = list(ESTIMATORS) if names is None else names
+    return np.column_stack([ESTIMATORS[name](samples, c, k) for name in names])
+
+
+# This function runs one block of replications, one seed per replication, for
+# the given (scenario index, estimator name) cells, and returns a dict from
+# each cell to its values over the block
+def _run_block(seeds, cells, n, c, k):
+    scenarios = [make_scenarios(np.random.default_rng(seed), n) for seed in seeds]
+    out = {}
+    for s in sorted({s for s, _ in cells}):
+        names = [name for t, name in cells if t == s]
+        values = apply_estimators(np.array([reps[s] for reps in scenarios]), c, k, names)
+        out.update({(s, name): values[:, i] for i, name in enumerate(names)})
+    return out
+
+
+# This function returns the result store key of one cell of one block
+def _cell_key(s, name, n, c, k, seed, start, size):
+    return {'estimator': name, 'scenario': SCENARIOS[s], 'n': n, 'p': 1,
+            'contamination': EXTRA_POINTS[s] / (n + EXTRA_POINTS[s]), 'seed': seed,
+            'block': start, 'block_size': size, 'c': c, 'k': k}
+
+
+# This function runs n_reps replications and returns the estimates as a
+# (replications x scenarios x estimators) array. With n_workers=1 everything
+# runs in this process, otherwise blocks of block_size replications are
+# spread over a process pool (n_workers=None uses every core).
+#
+# If a ResultStore is given, each block's values for each (estimator, data
+# set) cell are written to it as soon as the block finishes, and cells which
+# are already in the store are not recomputed. This needs a fixed integer seed.
+def run_replications(n_reps=100, seed=None, n_workers=None, n=200, c=1.7, k=0.25, block_size=25,
+                     store=None):
+    if store is not None and not isinstance(seed, (int, np.integer)):
+        raise ValueError('a result store needs a fixed integer seed')
+
+    seeds = np.random.SeedSequence(seed).spawn(n_reps)
+    starts = range(0, n_reps, block_size)
+    all_cells = [(s, name) for s in range(len(SCENARIOS)) for name in ESTIMATORS]
+
+    def key(cell, start):
+        return _cell_key(*cell, n, c, k, seed, start, len(seeds[start:start + block_size]))
+
+    # The cells of each block which still have to be computed
+    todo = {}
+    for start in starts:
+        cells = all_cells if store is None else [cell for cell in all_cells if key(cell, start) not in store]
+        if cells:
+            todo[start] = cells
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    run_block = partial(_run_block, n=n, c=c, k=k)
+    computed = {}
+
+    def finish(start, values):
+        for cell, cell_values in values.items():
+            if store is not None:
+                store.put(key(cell, start), cell_values)
+            computed[cell, start] = cell_values
+
+    if n_workers == 1 or len(todo) <= 1:
+        for start, cells in todo.items():
+            finish(start, run_block(seeds[start:start + block_size], cells))
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(todo))) as pool:
+            futures = {pool.submit(run_block, seeds[start:start + block_size], cells): start
+                       for start, cells in todo.items()}
+            for future in as_completed(futures):
+                finish(futures[future], future.result())
+
+    results = np.empty((n_reps, len(SCENARIOS), len(ESTIMATORS)))
+    for start in starts:
+        for s, name in all_cells:
+            values = computed.get(((s, name), start))
+            if values is None:
+                values = store.get(key((s, name), start))
+            results[start:start + block_size, s, list(ESTIMATORS).index(name)] = values
+
+    return results
+
+
+# This function builds the summary table from the replications: the mean and
+# sample SD of each estimator on each data set (rounded to 3 d.p.), and the
+# percentage change in the means between the first and each later data set
+def summary_table(results):
+    means = np.round(results.mean(axis=0), 3)
+    sds = np.round(results.std(axis=0, ddof=1), 3)
+    perc = 100 * np.abs(means - means[0]) / means[0]
+
+    def cells(s):
+        return [f'{m}, {sd}' for m, sd in zip(means[s], sds[s])]
+
+    d = {'Data A': cells(0), 'Data B': cells(1), '% diff A B': perc[1], 'Data C': cells(2),
+         '% diff A C ': perc[2], 'Data D': cells(3), '% diff A, D': perc[3]}
+    df = pd.DataFrame(data=d)
+    df.index = list(ESTIMATORS)
+
+    return df
+
+
+# This function runs the whole study and returns the table
+def run_study(n_reps=100, seed=None, n_workers=None, **kwargs):
+    return summary_table(run_replications(n_reps, seed, n_workers, **kwargs))
@@ -0,0 +1,162 @@
+'''
+SEQUENTIAL UPDATE
+
+In this code we update a posterior when new observations are added to the data (such as the
+point at 20 added to the data of prior_testing2.py), without sampling the new model from
+scratch. The posterior given the new data is the old posterior times the likelihood of the
+new observations, so the existing draws are reweighted by that likelihood. The weights are
+Pareto smoothed (PSIS, with az.psislw), and their Pareto k and effective sample size say
+whether the reweighted draws can be trusted.
+
+If they can, the draws are resampled by their weights. If not (k above 0.7, or the effective
+sample size collapsed, as it does when the new point is an outlier far into the tail of the
+old posterior), the draws are moved to the new posterior by likelihood tempered SMC: the
+likelihood of the new observations is brought in as a power rising from 0 to 1 over several
+stages, each raising the power only as far as keeps the effective sample size of the stage
+weights at a fraction of the draws. At every stage the draws are reweighted, resampled, and
+moved by random walk Metropolis steps targeting that stage's posterior, with a proposal
+scale taken from the current draws. This needs the new log posterior as a function. Either
+way the result is an InferenceData of the same shape as the old one.
+
+'''
+
+
+from collections import namedtuple
+
+import numpy as np
+
+from tempered_likelihood import logpdf, tempered_loglik
+
+
+UpdateResult = namedtuple('UpdateResult', ['trace', 'log_weights', 'khat', 'ess', 'rejuvenated', 'stages'])
+
+
+###############################################################
+##################### Helper functions ########################
+###############################################################
+
+# This function returns the log likelihood of the observations new, raised to
+# the power alpha, as a function of an array of mu
+def loglik_function(new, likelihood='normal', sigma=1.0, alpha=1.0, **params):
+    return lambda mu: tempered_loglik(new, mu, alpha, likelihood, sigma, **params)
+
+
+# This function returns the (unnormalised) log posterior of mu given all the
+# data, as a function of an array of mu, for a prior given as in
+# grid_posterior.py
+def log_posterior_function(data, prior, likelihood='normal', sigma=1.0, alpha=1.0, **params):
+    return lambda mu: logpdf(mu, **prior) + tempered_loglik(data, mu, alpha, likelihood, sigma, **params)
+
+
+# This function returns the indices of a systematic resample of len(weights)
+# draws with the given (normalised) weights
+def _systematic_resample(weights, rng):
+    n = len(weights)
+    positions = (rng.uniform() + np.arange(n)) / n
+    cumulative = np.cumsum(weights)
+    cumulative[-1] = 1.0
+    return np.searchsorted(cumulative, positions)
+
+
+# This function returns the normalised weights proportional to exp(log_weights)
+# and their effective sample size
+def _normalised(log_weights):
+    weights = np.exp(log_weights - np.max(log_weights))
+    weights /= weights.sum()
+    return weights, 1 / np.sum(weights ** 2)
+
+
+# This function returns the largest step (at most max_step) of the power of
+# the new likelihood whose weights exp(step * loglik) keep an effective sample
+# size of at least target_ess, by bisection
+def _next_step(loglik, max_step, target_ess, tol=1e-6):
+    if _normalised(max_step * loglik)[1] >= target_ess:
+        return max_step
+    lo, hi = 0.0, max_step
+    while hi - lo > tol * max_step:
+        mid = (lo + hi) / 2
+        if _normalised(mid * loglik)[1] >= target_ess:
+            lo = mid
+        else:
+            hi = mid
+    return max(lo, tol * max_step)
+
+
+# This function moves every draw by n_moves random walk Metropolis steps
+# targeting log_target, with normal proposals of SD scale
+def _metropolis_moves(x, log_target, scale, n_moves, rng):
+    current = log_target(x)
+    accepted = 0
+    for _ in range(n_moves):
+        proposal = x + scale * rng.standard_normal(x.shape)
+        proposed = log_target(proposal)
+        accept = np.log(rng.uniform(size=x.shape)) < proposed - current
+        x = np.where(accept, proposal, x)
+        current = np.where(accept, proposed, current)
+        accepted += accept.sum()
+    return x, accepted / (n_moves * x.size)
+
+
+# This function moves the draws x of the old posterior to the new one by
+# likelihood tempered SMC, returning the new draws and the number of stages.
+# The target at power beta of the new likelihood is log_target minus (1 -
+# beta) times log_lik_new, i.e. the old posterior times the new likelihood to
+# the power beta. Each stage raises beta as far as keeps the effective sample
+# size of its weights at ess_fraction of the draws, then resamples, and moves
+# the draws by n_moves Metropolis steps with SD 2.38 times that of the draws.
+def _tempered_smc(x, log_lik_new, log_target, n_moves, ess_fraction, rng):
+    beta = 0.0
+    stages = 0
+    while beta < 1:
+        loglik = log_lik_new(x)
+        step = _next_step(loglik, 1 - beta, ess_fraction * len(x))
+        beta = 1.0 if step >= 1 - beta else beta + step
+        weights, _ = _normalised(step * loglik)
+        x = x[_systematic_resample(weights, rng)]
+
+        scale = 2.38 * np.std(x)
+        if scale > 0:
+            stage = beta
+            x, _ = _metropolis_moves(x, lambda mu: log_target(mu) - (1 - stage) * log_lik_new(mu),
+                                     scale, n_moves, rng)
+        stages += 1
+    return x, stages
+
+
+###############################################################
+#################### Define functions #########################
+###############################################################
+
+# This function updates the posterior of var_name in trace (an InferenceData)
+# with new observations whose log likelihood is log_lik_new(mu). The draws
+# are reweighted with PSIS, and resampled if the Pareto k is at most khat_max
+# and the effective sample size is at least min_ess times the number of draws.
+# Otherwise they are moved by likelihood tempered SMC (see _tempered_smc) to
+# log_target(mu), the log posterior given all the data, with n_moves
+# Metropolis steps per stage and stages keeping an effective sample size of
+# ess_fraction of the draws.
+def update_posterior(trace, log_lik_new, log_target=None, var_name='mu', khat_max=0.7, min_ess=0.1,
+                     n_moves=10, ess_fraction=0.5, seed=None):
+    import arviz as az
+
+    rng = np.random.default_rng(seed)
+    draws = trace.posterior[var_name].values
+    x = draws.ravel()
+
+    log_weights, khat = az.psislw(log_lik_new(x))
+    log_weights = np.asarray(log_weights)
+    khat = float(khat)
+    weights, ess = _normalised(log_weights)
+
+    rejuvenated = khat > khat_max or ess < min_ess * len(x)
+    stages = 0
+    if rejuvenated:
+        if log_target is None:
+            raise ValueError(f'the importance weights are unreliable (k = {khat:.2f}, ESS = {ess:.0f}), '
+                             'so log_target is needed to rejuvenate the draws')
+        x, stages = _tempered_smc(x, log_lik_new, log_target, n_moves, ess_fraction, rng)
+    else:
+        x = x[_systematic_resample(weights, rng)]
+
+    updated = az.from_dict(posterior={var_name: x.reshape(draws.shape)})
+    return UpdateResult(updated, log_weights, khat, ess, rejuvenated, stages)
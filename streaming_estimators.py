@@ -0,0 +1,276 @@
+'''
+STREAMING SCALE ESTIMATORS
+
+Online versions of the scale estimators in SD_estimaors_repeat.py for data which arrives
+in batches and is too long to keep in memory. Every estimator has the same interface:
+update(batch) adds a batch of data, merge(other) adds the state of another estimator of
+the same kind (e.g. one run on another shard of the data), and result() returns the
+current estimate. The memory used is fixed, however long the stream is.
+
+The sample SD is exact (Welford/Chan updates of the mean and sum of squares). The absolute
+deviation keeps the exact running mean and a QuantileSketch holding the count and sum of
+the data in logarithmically spaced buckets. The MAD is read off a QuantileSketch of the
+data, which is accurate to within relative_accuracy of the data values.
+
+'''
+
+
+import numpy as np
+
+
+###############################################################
+##################### Quantile sketch #########################
+###############################################################
+
+# A mergeable sketch of a data stream (in the style of DDSketch). Non-zero
+# values are put into buckets (gamma^(i-1), gamma^i] of their absolute value,
+# with gamma = (1 + relative_accuracy) / (1 - relative_accuracy), kept
+# separately for positive and negative values, and each bucket records how
+# many values fell into it and their sum. Any value read back from the sketch
+# is then within relative_accuracy of a value in the data. If the number of
+# buckets passes max_buckets, the buckets nearest zero are merged, so only
+# the accuracy for the smallest values is lost. Each bucket also records the
+# index of the lowest bucket merged into it, so its bounds always cover every
+# value it holds.
+class QuantileSketch:
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f'relative_accuracy must be in (0, 1), got {relative_accuracy}')
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+
+        # bucket index -> [count, sum, lowest merged index], for positive and
+        # negative values
+        self._positive = {}
+        self._negative = {}
+        self.zero_count = 0
+        self.count = 0
+        self._arrays = None
+
+    def update(self, batch):
+        x = np.asarray(batch, dtype=float).ravel()
+        x = x[~np.isnan(x)]
+        if len(x) == 0:
+            return self
+
+        self.zero_count += int(np.count_nonzero(x == 0))
+        self._add(self._positive, x[x > 0])
+        self._add(self._negative, -x[x < 0])
+        self.count += len(x)
+        self._collapse()
+        self._arrays = None
+        return self
+
+    def merge(self, other):
+        self._check_compatible(other)
+        for store, other_store in ((self._positive, other._positive), (self._negative, other._negative)):
+            for i, (count, total, lowest) in other_store.items():
+                bucket = store.setdefault(i, [0, 0.0, i])
+                bucket[0] += count
+                bucket[1] += total
+                bucket[2] = min(bucket[2], lowest)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self._collapse()
+        self._arrays = None
+        return self
+
+    # This function returns the q-quantile (0 <= q <= 1) of the data, taking
+    # the lower of the two middle values as np.percentile's 'lower' method does
+    def quantile(self, q):
+        values, counts, _, _, _ = self.buckets()
+        if len(values) == 0:
+            return np.nan
+        return _order_statistic(values, counts, int(np.floor(q * (self.count - 1))))
+
+    # This function returns the median of the data, averaging the two middle
+    # values when the count is even
+    def median(self):
+        values, counts, _, _, _ = self.buckets()
+        if len(values) == 0:
+            return np.nan
+        return _median(values, counts)
+
+    # This function returns the buckets in increasing order as arrays of their
+    # representative value, count, sum, and lower and upper bounds
+    def buckets(self):
+        if self._arrays is None:
+            neg = sorted(self._negative.items(), reverse=True)
+            pos = sorted(self._positive.items())
+            neg_i = np.array([i for i, _ in neg], dtype=float)
+            pos_i = np.array([i for i, _ in pos], dtype=float)
+
+            # The representative value is the centre of the bucket in
+            # relative terms, 2 gamma^i / (gamma + 1)
+            scale = 2 / (self.gamma + 1)
+            values = np.concatenate((-scale * self.gamma ** neg_i, [0.0], scale * self.gamma ** pos_i))
+            counts = np.array([b[0] for _, b in neg] + [self.zero_count] + [b[0] for _, b in pos], dtype=float)
+            # The negative store holds magnitudes, so its sums are negated
+            sums = np.array([-b[1] for _, b in neg] + [0.0] + [b[1] for _, b in pos])
+            neg_lowest = np.array([b[2] for _, b in neg], dtype=float)
+            pos_lowest = np.array([b[2] for _, b in pos], dtype=float)
+            lower = np.concatenate((-self.gamma ** neg_i, [0.0], self.gamma ** (pos_lowest - 1)))
+            upper = np.concatenate((-self.gamma ** (neg_lowest - 1), [0.0], self.gamma ** pos_i))
+
+            keep = counts > 0
+            self._arrays = (values[keep], counts[keep], sums[keep], lower[keep], upper[keep])
+        return self._arrays
+
+    def _add(self, store, magnitudes):
+        if len(magnitudes) == 0:
+            return
+        index = np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+        keys, inverse = np.unique(index, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = np.bincount(inverse, weights=magnitudes)
+        for i, count, total in zip(keys.tolist(), counts.tolist(), sums.tolist()):
+            bucket = store.setdefault(i, [0, 0.0, i])
+            bucket[0] += count
+            bucket[1] += total
+
+    # Merge the buckets nearest zero until there are at most max_buckets
+    def _collapse(self):
+        while len(self._positive) + len(self._negative) > self.max_buckets:
+            store = self._positive if len(self._positive) >= len(self._negative) else self._negative
+            lowest, second = sorted(store)[:2]
+            count, total, merged = store.pop(lowest)
+            store[second][0] += count
+            store[second][1] += total
+            store[second][2] = min(store[second][2], merged)
+
+    def _check_compatible(self, other):
+        if type(other) is not type(self) or other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('can only merge sketches with the same relative_accuracy')
+
+    # The cached bucket arrays are not pickled; they are rebuilt when needed
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    # Sketches pickled before buckets recorded their lowest merged index get
+    # their own index
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for store in (self._positive, self._negative):
+            for i, bucket in store.items():
+                if len(bucket) == 2:
+                    bucket.append(i)
+
+
+# This function returns the order statistic of (0-based) rank r of data given
+# as sorted values with counts
+def _order_statistic(values, counts, r):
+    return values[np.searchsorted(np.cumsum(counts), r, side='right')]
+
+
+# This function returns the median of data given as sorted values with counts
+def _median(values, counts):
+    n = int(counts.sum())
+    return (_order_statistic(values, counts, (n - 1) // 2) + _order_statistic(values, counts, n // 2)) / 2
+
+
+###############################################################
+#################### Streaming estimators #####################
+###############################################################
+
+# The online sample standard deviation. Each batch is summarised by its count,
+# mean and sum of squared deviations, and combined with the running values
+# using the update of Chan, Golub and LeVeque (Welford's update for a batch).
+class OnlineSD:
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.sum_sq = 0.0
+
+    def update(self, batch):
+        x = np.asarray(batch, dtype=float).ravel()
+        if len(x) > 0:
+            mu = x.mean()
+            self._combine(len(x), mu, ((x - mu) ** 2).sum())
+        return self
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.sum_sq)
+        return self
+
+    def result(self):
+        if self.count < 2:
+            return np.nan
+        return np.sqrt(self.sum_sq / (self.count - 1))
+
+    def _combine(self, count, mu, sum_sq):
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mu - self.mean
+        self.sum_sq += sum_sq + delta ** 2 * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+
+
+# The online normalised absolute deviation, sqrt(pi/2) / (n-1) * sum |x - mean|.
+# The mean is tracked exactly; the sum of absolute deviations is found at the
+# end from the bucket counts and sums of a QuantileSketch. Every bucket which
+# lies entirely on one side of the mean contributes exactly, so the only error
+# comes from the bucket containing the mean, which is at most relative_accuracy
+# times |mean| for each value in it.
+class OnlineAbsDev:
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        self._moments = OnlineSD()
+        self.sketch = QuantileSketch(relative_accuracy, max_buckets)
+
+    def update(self, batch):
+        x = np.asarray(batch, dtype=float).ravel()
+        self._moments.update(x)
+        self.sketch.update(x)
+        return self
+
+    def merge(self, other):
+        self._moments.merge(other._moments)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def result(self):
+        n = self._moments.count
+        if n < 2:
+            return np.nan
+        mu = self._moments.mean
+
+        _, counts, sums, lower, upper = self.sketch.buckets()
+        above = sums - counts * mu
+        sum_abs = np.where(lower >= mu, above, np.where(upper <= mu, -above, np.abs(above))).sum()
+
+        return np.sqrt(np.pi / 2) / (n - 1) * sum_abs
+
+
+# The online (unnormalised) MAD. The median is read off a QuantileSketch of the
+# data, and the MAD is the median of the distances from each bucket value to
+# it. As every bucket value is within relative_accuracy of the values it
+# stands for, the result is within relative_accuracy * (2 |median| + MAD) of
+# the MAD of the data.
+class OnlineMAD:
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        self.sketch = QuantileSketch(relative_accuracy, max_buckets)
+
+    def update(self, batch):
+        self.sketch.update(batch)
+        return self
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        return self
+
+    def result(self):
+        values, counts, _, _, _ = self.sketch.buckets()
+        if len(values) == 0:
+            return np.nan
+        dist = np.abs(values - _median(values, counts))
+        order = np.argsort(dist)
+        return _median(dist[order], counts[order])
@@ -0,0 +1,122 @@
+'''
+TEMPERED FAMILY
+
+Normalised tempered densities, p(x)^alpha / Z(alpha) with Z(alpha) the integral of p^alpha,
+for the Normal, Cauchy and Student-t families of tempered_likelihood.py. Raising a density to
+a power alpha (as in Dists_to_alpha.py) does not give a density, and the normaliser changes
+with alpha, so the curves for different alphas cannot be compared as they are.
+
+With z = (x - mu) / sigma and p(x) = f(z) / sigma, Z(alpha) = sigma^(1 - alpha) times the
+integral of f(z)^alpha, which has a closed form for all three families:
+
+    Normal      (2 pi)^((1 - alpha) / 2) alpha^(-1/2)
+    Student-t   c^alpha sqrt(nu pi) Gamma(a - 1/2) / Gamma(a),  a = alpha (nu + 1) / 2
+    Cauchy      the Student-t with nu = 1
+
+where c is the normalising constant of the Student-t. The Student-t and Cauchy are only
+integrable when a > 1/2 (alpha > 1 / (nu + 1)). Below that the log normaliser is inf, and
+the log density is -inf.
+These are evaluated for a whole array of alphas at once, so a sweep over hundreds of alphas
+costs about as much as one. A family without a closed form, or method='quad', uses numerical
+integration of f^alpha instead, memoised with an LRU cache keyed by the family, its shape
+parameters and alpha, so repeated sweeps over the same alphas only integrate once.
+
+'''
+
+
+from functools import lru_cache
+
+import numpy as np
+from scipy.integrate import quad
+from scipy.special import gammaln
+
+from tempered_likelihood import FAMILIES, logpdf
+
+
+_LOG_PI = np.log(np.pi)
+_LOG_2PI = np.log(2 * np.pi)
+
+
+###############################################################
+###################### Log normalisers ########################
+###############################################################
+
+# These functions return the log of the integral of f(z)^alpha for the
+# standardised density f of each family, for an array of alpha
+
+def _normal_log_integral(alpha):
+    return 0.5 * (1 - alpha) * _LOG_2PI - 0.5 * np.log(alpha)
+
+
+def _t_log_integral(alpha, nu=3.0):
+    a = alpha * (nu + 1) / 2
+    log_c = gammaln((nu + 1) / 2) - gammaln(nu / 2) - 0.5 * (np.log(nu) + _LOG_PI)
+    with np.errstate(invalid='ignore'):
+        value = alpha * log_c + 0.5 * (np.log(nu) + _LOG_PI) + gammaln(a - 0.5) - gammaln(a)
+    return np.where(a > 0.5, value, np.inf)
+
+
+def _cauchy_log_integral(alpha):
+    return _t_log_integral(alpha, nu=1.0)
+
+
+_LOG_INTEGRALS = {'normal': _normal_log_integral, 'cauchy': _cauchy_log_integral, 't': _t_log_integral}
+
+
+# This function returns the log of the integral of f(z)^alpha by quadrature,
+# for the family with shape parameters params (a tuple of (name, value)
+# pairs), memoised on all three. The integral is of exp(alpha log f), which
+# is at most 1 near the mode, so it does not overflow. quad cannot tell a
+# divergent integral from a slowly converging one, so the Cauchy and
+# Student-t tails, (1 + z^2 / nu)^(-a), are checked for a > 1/2 first.
+@lru_cache(maxsize=4096)
+def _quad_log_integral(family, params, alpha):
+    nu = {'cauchy': 1.0, 't': dict(params).get('nu', 3.0)}.get(family)
+    if nu is not None and alpha * (nu + 1) / 2 <= 0.5:
+        return np.inf
+    peak = alpha * logpdf(0.0, family, **dict(params))
+    half, _ = quad(lambda z: np.exp(alpha * logpdf(z, family, **dict(params)) - peak), 0, np.inf, limit=200)
+    return peak + np.log(2 * half)
+
+
+###############################################################
+#################### Define functions #########################
+###############################################################
+
+class TemperedDistribution:
+
+    def __init__(self, family, mu=0.0, sigma=1.0, **params):
+        if family not in FAMILIES:
+            raise ValueError(f'family must be one of {sorted(FAMILIES)}, got {family!r}')
+        self.family = family
+        self.mu = mu
+        self.sigma = sigma
+        self.params = {name: params[name] for name in FAMILIES[family] if name in params}
+
+    # This function returns log Z(alpha), of the shape of alpha, from the
+    # closed form, or by quadrature if method is 'quad'
+    def log_normaliser(self, alpha, method='closed'):
+        alpha = np.asarray(alpha, dtype=float)
+        if np.any(alpha <= 0):
+            raise ValueError('alpha must be positive')
+
+        if method == 'closed' and self.family in _LOG_INTEGRALS:
+            log_integral = _LOG_INTEGRALS[self.family](alpha, **self.params)
+        elif method in ('closed', 'quad'):
+            key = tuple(sorted(self.params.items()))
+            log_integral = np.reshape([_quad_log_integral(self.family, key, a) for a in alpha.ravel()],
+                                      alpha.shape)
+        else:
+            raise ValueError(f"method must be 'closed' or 'quad', got {method!r}")
+        return (1 - alpha) * np.log(self.sigma) + log_integral
+
+    # This function returns the normalised tempered log density at every alpha
+    # and x, as an array of shape alpha.shape + x.shape
+    def logpdf(self, x, alpha, method='closed'):
+        alpha = np.asarray(alpha, dtype=float)
+        log_p = logpdf(np.asarray(x, dtype=float), self.family, self.mu, self.sigma, **self.params)
+        log_z = self.log_normaliser(alpha, method)
+        return np.multiply.outer(alpha, log_p) - log_z.reshape(alpha.shape + (1,) * np.ndim(log_p))
+
+    def pdf(self, x, alpha, method='closed'):
+        return np.exp(self.logpdf(x, alpha, method))
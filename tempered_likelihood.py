@@ -0,0 +1,127 @@
+'''
+TEMPERED LIKELIHOOD
+
+The tempered (power) likelihoods of Figure 3.3, where the likelihood is raised to a power
+alpha, for the Cauchy, Normal and Student-t families with location mu and scale sigma. The
+log of a tempered likelihood is alpha times the log likelihood, so it is evaluated in log
+space from logpdf formulas written with log1p, rather than as log(pdf ** alpha). This avoids
+the power and exp work per observation, and does not underflow to log(0) for far outliers
+such as the point at 200 in Likelihood_alpha_testing.py.
+
+The logpdf functions work with NumPy arrays (backend='numpy') or PyTensor variables
+(backend='pytensor'), so the same formulas are used inside a PyMC model, where PyTensor
+differentiates them symbolically for NUTS. With NumPy, tempered_loglik and tempered_grad_mu
+evaluate the tempered log likelihood of the whole data set and its analytic derivative in mu
+over grids of mu and alpha at once.
+
+'''
+
+
+from types import SimpleNamespace
+
+import numpy as np
+from scipy.special import gammaln
+
+
+# The families, and the extra parameters each one takes
+FAMILIES = {'cauchy': (), 'normal': (), 't': ('nu',)}
+
+_LOG_PI = np.log(np.pi)
+_LOG_2PI = np.log(2 * np.pi)
+
+
+# This function returns the maths functions of a backend
+def _backend(name):
+    if name == 'numpy':
+        return SimpleNamespace(log=np.log, log1p=np.log1p, gammaln=gammaln, abs=np.abs,
+                               minimum=np.minimum, maximum=np.maximum, where=np.where)
+    if name == 'pytensor':
+        import pytensor.tensor as pt
+
+        return SimpleNamespace(log=pt.log, log1p=pt.log1p, gammaln=pt.gammaln, abs=pt.abs,
+                               minimum=pt.minimum, maximum=pt.maximum, where=pt.switch)
+    raise ValueError(f"backend must be 'numpy' or 'pytensor', got {name!r}")
+
+
+# This function returns log(1 + z^2) without overflowing for huge |z|, using
+# log(1 + z^2) = 2 log|z| + log(1 + 1 / z^2) when |z| > 1
+def _log1p_square(z, xp):
+    a = xp.abs(z)
+    small = xp.minimum(a, 1)
+    big = xp.maximum(a, 1)
+    return xp.where(a > 1, 2 * xp.log(big) + xp.log1p((1 / big) ** 2), xp.log1p(small ** 2))
+
+
+###############################################################
+######################## Log densities ########################
+###############################################################
+
+def cauchy_logpdf(x, mu=0.0, sigma=1.0, backend='numpy'):
+    xp = _backend(backend)
+    z = (x - mu) / sigma
+    return -_LOG_PI - xp.log(sigma) - _log1p_square(z, xp)
+
+
+def normal_logpdf(x, mu=0.0, sigma=1.0, backend='numpy'):
+    xp = _backend(backend)
+    z = (x - mu) / sigma
+    return -0.5 * _LOG_2PI - xp.log(sigma) - 0.5 * z ** 2
+
+
+def t_logpdf(x, mu=0.0, sigma=1.0, nu=3.0, backend='numpy'):
+    xp = _backend(backend)
+    z = (x - mu) / sigma
+    return (xp.gammaln((nu + 1) / 2) - xp.gammaln(nu / 2) - 0.5 * (xp.log(nu) + _LOG_PI)
+            - xp.log(sigma) - (nu + 1) / 2 * _log1p_square(z / nu ** 0.5, xp))
+
+
+# This function returns the log density of the family at x
+def logpdf(x, family, mu=0.0, sigma=1.0, backend='numpy', **params):
+    if family == 'cauchy':
+        return cauchy_logpdf(x, mu, sigma, backend)
+    if family == 'normal':
+        return normal_logpdf(x, mu, sigma, backend)
+    if family == 't':
+        return t_logpdf(x, mu, sigma, params.get('nu', 3.0), backend)
+    raise ValueError(f'family must be one of {sorted(FAMILIES)}, got {family!r}')
+
+
+# This function returns the derivative of the log density in mu at x, which is
+# z / sigma for the Normal, 2z / (sigma (1 + z^2)) for the Cauchy and
+# (nu + 1) z / (sigma (nu + z^2)) for the Student-t, with z = (x - mu) / sigma
+def grad_mu(x, family, mu=0.0, sigma=1.0, **params):
+    z = (np.asarray(x, dtype=float) - mu) / sigma
+    if family == 'cauchy':
+        return 2 * z / (sigma * (1 + z ** 2))
+    if family == 'normal':
+        return z / sigma
+    if family == 't':
+        nu = params.get('nu', 3.0)
+        return (nu + 1) * z / (sigma * (nu + z ** 2))
+    raise ValueError(f'family must be one of {sorted(FAMILIES)}, got {family!r}')
+
+
+###############################################################
+################### Tempered log likelihood ###################
+###############################################################
+
+# This function applies func to every data point at every mu, and sums over
+# the data, returning an array of the shape of mu
+def _sum_over_data(func, data, mu):
+    data = np.asarray(data, dtype=float).ravel()
+    mu = np.asarray(mu, dtype=float)
+    return func(data.reshape((-1,) + (1,) * mu.ndim), mu).sum(axis=0)
+
+
+# This function returns alpha times the log likelihood of the data, for every
+# alpha and mu, as an array of shape alpha.shape + mu.shape
+def tempered_loglik(data, mu, alpha, family='cauchy', sigma=1.0, **params):
+    total = _sum_over_data(lambda x, m: logpdf(x, family, m, sigma, **params), data, mu)
+    return np.multiply.outer(np.asarray(alpha, dtype=float), total)
+
+
+# This function returns the derivative in mu of tempered_loglik, of the same
+# shape
+def tempered_grad_mu(data, mu, alpha, family='cauchy', sigma=1.0, **params):
+    total = _sum_over_data(lambda x, m: grad_mu(x, family, m, sigma, **params), data, mu)
+    return np.multiply.outer(np.asarray(alpha, dtype=float), total)
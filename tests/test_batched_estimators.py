@@ -0,0 +1,25 @@
+import numpy as np
+
+from SD_estimaors_repeat import S_n, Q_n
+from batched_estimators import batched_S_n, batched_Q_n, stack_ragged
+
+
+def test_batched_S_n_and_Q_n_match_single_sample():
+    rng = np.random.default_rng(0)
+    samples = rng.normal(size=(60, 41))
+    samples[:20] = np.round(samples[:20], 1)
+    samples[20] = 3.0
+
+    assert np.array_equal(batched_S_n(samples), [S_n(x) for x in samples])
+    for k in (0.1, 0.25, 0.5):
+        assert np.array_equal(batched_Q_n(samples, k), [Q_n(x, k) for x in samples])
+
+
+def test_batched_S_n_and_Q_n_match_single_sample_ragged():
+    rng = np.random.default_rng(1)
+    samples = [np.round(rng.normal(size=n), 1) for n in rng.integers(2, 80, size=100)]
+    samples.append(rng.normal(size=700))
+    values, offsets = stack_ragged(samples)
+
+    assert np.array_equal(batched_S_n(values, offsets), [S_n(x) for x in samples])
+    assert np.array_equal(batched_Q_n(values, 0.25, offsets), [Q_n(x, 0.25) for x in samples])
@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pytest
+
+import daily_index
+from daily_index import DailyIndex
+
+
+HEADER = 'date-time,temperature\n'
+
+
+def write_log(path, days, text=''):
+    lines = [f'2012/{month:02d}/{day:02d} 12:00,{month + day}\n' for month, day in days]
+    path.write_text(HEADER + ''.join(lines) + text)
+
+
+# This function returns the count, sum and (approximate) median of the
+# readings of every day
+def summary(index):
+    return index.count[:, 0].tolist(), index.sum[:, 0].tolist(), np.round(index.median(0)).tolist()
+
+
+def test_finished_log_counts_its_last_line(tmp_path):
+    path = tmp_path / 'log.csv'
+    write_log(path, [(1, 1)], '2012/01/02 12:00,3')
+
+    assert DailyIndex.open(str(path)).count[:, 0].tolist() == [1]
+    index = DailyIndex.open(str(path), include_partial=True)
+    assert index.count[:, 0].tolist() == [1, 1]
+
+    # The counted line is extended, so the index must be rebuilt
+    with open(path, 'a') as f:
+        f.write('0\n2012/01/03 12:00,4\n')
+    index = DailyIndex.open(str(path))
+    assert index.count[:, 0].tolist() == [1, 1, 1]
+    assert index.sum[:, 0].tolist() == [2, 30, 4]
+
+
+# A crash while saving must leave the previous index usable, and the next
+# refresh must count the new readings once
+@pytest.mark.parametrize('rebuild', [False, True])
+def test_crash_while_saving_keeps_the_previous_index(tmp_path, monkeypatch, rebuild):
+    path = tmp_path / 'log.csv'
+    write_log(path, [(1, 1), (2, 1)])
+    before = summary(DailyIndex.open(str(path)))
+
+    if rebuild:
+        path.write_text(HEADER.replace('temperature', 'temp') + '2012/03/01 12:00,4\n')
+    else:
+        with open(path, 'a') as f:
+            f.write('2012/01/01 18:00,2\n2012/02/01 18:00,3\n')
+
+    dump = daily_index._dump
+
+    def crash(obj, target):
+        if target.endswith('.index'):
+            raise KeyboardInterrupt
+        dump(obj, target)
+
+    monkeypatch.setattr(daily_index, '_dump', crash)
+    with pytest.raises(KeyboardInterrupt):
+        DailyIndex.open(str(path))
+    monkeypatch.setattr(daily_index, '_dump', dump)
+
+    index = DailyIndex(str(path))
+    with open(index.index_path, 'rb') as f:
+        stored = daily_index.pickle.load(f)
+    assert summary(stored) == before
+
+    expected = ([1], [4], [4]) if rebuild else ([2, 2], [4, 6], [2, 3])
+    assert summary(DailyIndex.open(str(path))) == expected
+    assert sorted(os.listdir(index.sketch_dir)) == sorted(DailyIndex.open(str(path))._files.values())
@@ -0,0 +1,33 @@
+import numpy as np
+from scipy import stats
+from scipy.special import digamma
+
+from grid_posterior import grid_posterior_2d
+
+
+# With a flat prior on (mu, log sigma) and a Normal likelihood, mu is a
+# Student-t with n - 1 degrees of freedom, location the mean and scale
+# s / sqrt(n), and (n - 1) s^2 / sigma^2 is chi-squared with n - 1 degrees
+def test_grid_posterior_2d_normal_conjugate():
+    rng = np.random.default_rng(0)
+    data = rng.normal(1.0, 1.2, size=20)
+    n = len(data)
+
+    def log_p(mu, log_sigma):
+        sse = ((data[:, None, None] - mu) ** 2).sum(axis=0)
+        return -n * log_sigma - sse / (2 * np.exp(2 * log_sigma))
+
+    result = grid_posterior_2d(log_p, ((-5, 5), (-3, 3)))
+    mu, log_sigma = result.marginals
+
+    s2 = data.var(ddof=1)
+    t = stats.t(n - 1, data.mean(), np.sqrt(s2 / n))
+    assert np.isclose(mu.mean, t.mean(), atol=1e-6)
+    assert np.isclose(mu.sd, t.std(), rtol=1e-4)
+
+    expected = 0.5 * (np.log((n - 1) * s2) - digamma((n - 1) / 2) - np.log(2))
+    assert np.isclose(log_sigma.mean, expected, atol=1e-4)
+
+    # The grid zooms in on the mode rather than growing
+    assert result.x[0] > -5 and result.x[-1] < 6
+    assert result.y[0] > -3 and result.y[-1] < 3
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from scipy import integrate, stats
+
+from batched_estimators import stack_ragged
+from m_estimators import TUNING, batched_m_estimate, m_estimate
+
+
+# Small groups used to need hundreds of joint iterations of Proposal 2, well
+# past the default max_iter, when their clipped points nearly balanced
+def test_proposal2_converges_on_small_groups():
+    rng = np.random.default_rng(0)
+    for n in (3, 4, 6, 8, 10):
+        for data in (rng.normal(size=(5000, n)), rng.standard_t(1, size=(5000, n))):
+            result = batched_m_estimate(data, proposal2=True)
+            assert result.converged.all()
+
+    samples = [rng.standard_t(1, size=n) for n in rng.integers(3, 30, size=2000)]
+    values, offsets = stack_ragged(samples)
+    assert batched_m_estimate(values, offsets, proposal2=True).converged.all()
+
+
+def test_proposal2_solves_its_equations():
+    c = TUNING['huber']
+    beta = integrate.quad(lambda z: min(z * z, c * c) * stats.norm.pdf(z), -np.inf, np.inf)[0]
+    data = np.random.default_rng(1).standard_t(2, size=(2000, 12))
+    result = batched_m_estimate(data, proposal2=True, tol=1e-12)
+
+    psi = np.clip((data - result.location[:, None]) / result.scale[:, None], -c, c)
+    assert np.allclose(psi.sum(axis=1), 0, atol=1e-9)
+    assert np.allclose((psi ** 2).sum(axis=1), beta * (data.shape[1] - 1), atol=1e-9)
+
+
+# The Proposal 2 scale is consistent for the SD at the normal
+def test_proposal2_scale_is_consistent_at_the_normal():
+    result = m_estimate(np.random.default_rng(2).normal(3, 2, size=200000), proposal2=True)
+    assert result.converged
+    assert abs(result.location - 3) < 0.02
+    assert abs(result.scale / 2 - 1) < 0.01
+
+
+# Ragged samples given by offsets, and samples given by group ids, must give
+# the same estimates as solving each sample on its own
+@pytest.mark.parametrize('proposal2', [False, True])
+def test_ragged_and_grouped_samples_match_single_samples(proposal2):
+    rng = np.random.default_rng(3)
+    samples = [rng.standard_t(3, size=n) for n in rng.integers(5, 60, size=50)]
+    expected = [m_estimate(sample, proposal2=proposal2) for sample in samples]
+
+    values, offsets = stack_ragged(samples)
+    result = batched_m_estimate(values, offsets, proposal2=proposal2)
+    assert result.groups is None
+    assert np.allclose(result.location, [e.location for e in expected], rtol=0, atol=1e-12)
+    assert np.allclose(result.scale, [e.scale for e in expected], rtol=0, atol=1e-12)
+    assert np.array_equal(result.n_iter, [e.n_iter for e in expected])
+
+    # The same samples shuffled together, with ids given in reverse order
+    ids = np.repeat(np.arange(len(samples))[::-1] * 10, np.diff(offsets))
+    order = rng.permutation(len(values))
+    result = batched_m_estimate(values[order], groups=ids[order], proposal2=proposal2)
+    assert np.array_equal(result.groups, np.arange(len(samples)) * 10)
+    assert np.allclose(result.location[::-1], [e.location for e in expected], rtol=0, atol=1e-12)
+    assert np.allclose(result.scale[::-1], [e.scale for e in expected], rtol=0, atol=1e-12)
+
+    with pytest.raises(ValueError):
+        batched_m_estimate(values, offsets, groups=ids)
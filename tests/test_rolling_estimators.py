@@ -0,0 +1,24 @@
+import numpy as np
+
+from rolling_estimators import rolling_winsorized_mean
+
+
+# This function returns the mean of x Winsorized at the median plus or minus
+# scale * IQR, by clipping the whole window
+def brute_force_winsorized_mean(x, scale):
+    q1, m, q3 = np.percentile(x, [25, 50, 75])
+    return np.clip(x, m - scale * (q3 - q1), m + scale * (q3 - q1)).mean()
+
+
+# A huge outlier used to cancel out the precision of the running sums, even
+# after it had left the window
+def test_winsorized_mean_matches_brute_force_with_extreme_outliers():
+    rng = np.random.default_rng(0)
+    window = 96
+    x = rng.normal(10, 3, size=500)
+    x[[100, 150, 151, 300]] = [-1e17, 1e14, -1e300, 1e308]
+
+    result = rolling_winsorized_mean(x, window)
+    expected = [brute_force_winsorized_mean(x[t - window + 1:t + 1], 1.7) for t in range(window - 1, len(x))]
+    assert np.all(np.isnan(result[:window - 1]))
+    assert np.allclose(result[window - 1:], expected, rtol=0, atol=1e-12)
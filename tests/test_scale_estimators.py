@@ -0,0 +1,47 @@
+import numpy as np
+
+from SD_estimaors_repeat import Q_n
+
+
+# This function returns Q_n by sorting all the pairwise distances
+def brute_force_Q_n(data, k):
+    y = np.sort(data)
+    i, j = np.triu_indices(len(y), 1)
+    distances = np.sort(y[j] - y[i])
+    return distances[int(len(distances) // (1 / k))]
+
+
+def test_Q_n_matches_brute_force_on_tied_data():
+    rng = np.random.default_rng(0)
+    for decimals in (1, 0):
+        data = np.round(rng.normal(10, 5, size=2000), decimals)
+        for k in (0.1, 0.25, 0.5):
+            assert Q_n(data, k) == brute_force_Q_n(data, k)
+
+    data = rng.integers(0, 3, size=500).astype(float)
+    assert Q_n(data, 0.25) == brute_force_Q_n(data, 0.25)
+
+
+# This function returns Q_n from the counts of the distinct values, for data
+# with so many ties that the pairwise distances are too many to sort
+def tied_brute_force_Q_n(data, k):
+    values, counts = np.unique(data, return_counts=True)
+    i, j = np.triu_indices(len(values), 1)
+    distances = np.concatenate(([0.0], values[j] - values[i]))
+    pairs = np.concatenate(([np.sum(counts * (counts - 1) // 2)], counts[i] * counts[j]))
+    order = np.argsort(distances, kind='stable')
+    n = len(data)
+    position = int(n * (n - 1) // 2 // (1 / k))
+    return distances[order][np.searchsorted(np.cumsum(pairs[order]), position, side='right')]
+
+
+# Rounded readings such as the weather data have long runs of ties, which
+# used to move the row boundaries one position per pass (the time this takes
+# is measured by the 'Q_n (tied)' case of benchmark_estimators.py)
+def test_Q_n_matches_brute_force_on_heavily_tied_data():
+    data = np.round(np.random.default_rng(1).normal(10, 5, size=200000), 1)
+    for k in (0.1, 0.25, 0.5):
+        assert Q_n(data, k) == tied_brute_force_Q_n(data, k)
+
+    data = np.round(np.random.default_rng(2).normal(10, 5, size=2000), 1)
+    assert tied_brute_force_Q_n(data, 0.25) == brute_force_Q_n(data, 0.25)
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from sequential_update import loglik_function, update_posterior
+
+az = pytest.importorskip('arviz')
+
+
+# New observations far in the tail of a narrow old posterior collapse the
+# importance weights, so the draws have to be moved over many tempering stages
+def test_update_matches_the_conjugate_posterior_when_the_weights_collapse():
+    rng = np.random.default_rng(0)
+    trace = az.from_dict(posterior={'mu': rng.normal(0, 0.1, size=(4, 1000))})
+    new = np.full(100, 3.0)
+    log_lik_new = loglik_function(new, 'normal', 1.0)
+
+    result = update_posterior(trace, log_lik_new, lambda mu: -0.5 * (mu / 0.1) ** 2 + log_lik_new(mu), seed=1)
+
+    # The old posterior N(0, 0.1) times the likelihood of 100 points at 3 is
+    # N(1.5, 1 / sqrt(200))
+    mu = result.trace.posterior['mu'].values
+    assert result.rejuvenated and result.stages > 1
+    assert mu.shape == (4, 1000)
+    assert abs(mu.mean() - 1.5) < 0.01
+    assert abs(mu.std() - 200 ** -0.5) < 0.005
+    assert len(np.unique(mu)) > 0.9 * mu.size
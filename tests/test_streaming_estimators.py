@@ -0,0 +1,41 @@
+import numpy as np
+
+from streaming_estimators import OnlineAbsDev, QuantileSketch
+
+
+# Tiny values spread over many buckets, which a small max_buckets forces to be
+# merged into the buckets of the bulk of the data
+def collapsing_data(rng, sign=1):
+    x = np.concatenate((10 ** rng.uniform(-3, -2, size=100), rng.uniform(10, 11, size=10000)))
+    return sign * rng.permutation(x)
+
+
+def test_collapsed_buckets_cover_their_values():
+    rng = np.random.default_rng(0)
+    sketch = QuantileSketch(max_buckets=4)
+    other = QuantileSketch(max_buckets=4)
+    for batch in np.array_split(collapsing_data(rng), 10):
+        sketch.update(batch)
+        other.update(-batch)
+    sketch.merge(other)
+
+    _, counts, sums, lower, upper = sketch.buckets()
+    assert np.all(lower * counts <= sums) and np.all(sums <= upper * counts)
+
+
+# Once the sketch has collapsed, the absolute deviation can only be off in the
+# buckets whose bounds straddle the mean, by at most their width per value
+def test_abs_dev_stays_within_its_error_bound_after_a_collapse():
+    rng = np.random.default_rng(1)
+    for max_buckets in (2, 3, 4, 8):
+        x = collapsing_data(rng)
+        estimator = OnlineAbsDev(max_buckets=max_buckets)
+        for batch in np.array_split(x, 10):
+            estimator.update(batch)
+
+        factor = np.sqrt(np.pi / 2) / (len(x) - 1)
+        exact = factor * np.abs(x - x.mean()).sum()
+        _, counts, _, lower, upper = estimator.sketch.buckets()
+        straddle = (lower < x.mean()) & (upper > x.mean())
+        bound = factor * np.sum(counts[straddle] * (upper - lower)[straddle])
+        assert -1e-9 <= exact - estimator.result() <= bound
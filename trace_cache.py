@@ -0,0 +1,147 @@
+'''
+TRACE CACHE
+
+A cache on disk for the posterior traces of the Bayesian figures (prior_testing2.py and
+Likelihood_alpha_testing.py), so that re-running a script to re-plot or restyle a figure does
+not run MCMC again. Each trace is keyed by a SHA-256 hash of the observed data (its values,
+dtype and shape), the model specification (e.g. the prior family and its parameters, the
+likelihood and alpha) and the sampler settings (draws, tune, chains, random seed, ...), so any
+change to one of them gives a new key, and is stored as NetCDF.
+
+The cache has a maximum size. Reading a trace marks it as recently used, and when a new trace
+takes the cache over its size the least recently used traces are removed. As in
+result_store.py, files are written to a temporary name and then renamed, so a crash never
+leaves a half written trace behind.
+
+The model specification of a PyMC model should come from model_spec, which describes the
+model's own graph (every operation, with its parameters and the hashes of any constant or
+shared data, and the transforms of the free variables), rather than from a hand-written
+dict: then any edit to the model changes the key, and a stale trace is never returned.
+
+'''
+
+
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+# This function returns the SHA-256 hash of an array's dtype, shape and values
+def _digest(value):
+    value = np.ascontiguousarray(value)
+    digest = hashlib.sha256(json.dumps([value.dtype.str, value.shape]).encode())
+    digest.update(value.tobytes())
+    return digest.hexdigest()
+
+
+# This function returns a JSON description of a PyMC model (the current model
+# context if None) for the key of its traces. The graph of its random,
+# deterministic and potential variables is walked in topological order, and
+# every operation is listed with its inputs: earlier operations by position,
+# and constants and shared data (e.g. pm.Data and observed values) by hash.
+# Random generators are listed by type only, as their state changes as the
+# model is sampled.
+def model_spec(model=None):
+    import pymc as pm
+    from pytensor.compile.sharedvalue import SharedVariable
+    from pytensor.graph.basic import Constant, io_toposort
+
+    model = pm.modelcontext(model)
+    outputs = list(model.basic_RVs) + list(model.deterministics) + list(model.potentials)
+    nodes = io_toposort([], outputs)
+    position = {node: i for i, node in enumerate(nodes)}
+
+    def describe(var):
+        if var.owner is not None:
+            return ['node', position[var.owner], var.owner.outputs.index(var)]
+        if isinstance(var, Constant):
+            return ['constant', _digest(var.data)]
+        if isinstance(var, SharedVariable):
+            value = var.get_value(borrow=True)
+            if isinstance(value, (np.ndarray, np.generic, int, float)):
+                return ['shared', var.name, _digest(value)]
+            return ['shared', var.name, type(value).__name__]
+        return ['input', var.name, str(var.type)]
+
+    return {
+        'graph': [[str(node.op), [describe(var) for var in node.inputs]] for node in nodes],
+        'variables': {var.name: describe(var) for var in outputs},
+        'observed': {rv.name: describe(model.rvs_to_values[rv]) for rv in model.observed_RVs},
+        'transforms': {rv.name: type(model.rvs_to_transforms.get(rv)).__name__ for rv in model.free_RVs},
+    }
+
+
+class TraceCache:
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    # This function returns the key of a trace, a hash of the data, the model
+    # specification (see model_spec) and the sampler settings (both dicts of
+    # JSON values)
+    def key(self, data, model, sampler):
+        digest = hashlib.sha256(_digest(data).encode())
+        digest.update(json.dumps({'model': model, 'sampler': sampler}, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.nc')
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    # This function returns the trace stored under key, read fully into memory
+    # (so the file is not held open), and marks it as recently used
+    def get(self, key):
+        import arviz as az
+
+        path = self.path(key)
+        with az.rc_context({'data.load': 'eager'}):
+            trace = az.from_netcdf(path)
+        os.utime(path)
+        return trace
+
+    def put(self, key, trace):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            trace.to_netcdf(tmp)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict(keep=key)
+
+    # This function removes the least recently used traces until the cache is
+    # within max_bytes, never removing the trace keep
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.nc'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == f'{keep}.nc':
+                continue
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    # This function returns the cached trace for the data, model and sampler
+    # settings if there is one, and otherwise calls sample() (which should run
+    # the sampler with those settings), stores its trace and returns it
+    def sample(self, data, model, sampler, sample):
+        key = self.key(data, model, sampler)
+        if key in self:
+            return self.get(key)
+        trace = sample()
+        self.put(key, trace)
+        return trace
@@ -0,0 +1,159 @@
+'''
+VARIANCE SURFACES
+
+The (expected) variances of the estimators of location compared in Figure 1.2
+(optimal_weights_normal_huber.py), for a contamination fraction epsilon and a contaminating
+variance k:
+
+    X_t    the mean of the clean part only           1 / (1 - epsilon)
+    X_c    the mean of the contaminated part only    k / epsilon
+    X_bar  the mean of all the data                  1 - epsilon + k epsilon
+    X_w    the weighted mean with weights alpha, beta   alpha^2 (1 - epsilon) + beta^2 epsilon k
+
+where the weights satisfy (1 - epsilon) alpha + epsilon beta = 1. Every function broadcasts
+over arrays of epsilon and k, so whole grids are evaluated at once. The weight alpha which
+minimises the variance of X_w is found numerically by a golden section search run on every
+grid point together, and can be checked against the closed form alpha = k / (k + epsilon -
+epsilon k) from the report.
+
+Grids made by variance_grid are cached, so re-drawing a plot with the same grid does not
+recompute anything, and refine_grid adds grid lines where a surface is poorly resolved.
+
+'''
+
+
+from functools import lru_cache
+
+import numpy as np
+
+
+# The inverse of the golden ratio
+_INV_PHI = (np.sqrt(5) - 1) / 2
+
+
+###############################################################
+#################### Define functions #########################
+###############################################################
+
+def var_X_t(eps, k):
+    eps, k = np.broadcast_arrays(np.asarray(eps, dtype=float), np.asarray(k, dtype=float))
+    return 1 / (1 - eps)
+
+
+def var_X_c(eps, k):
+    return np.asarray(k, dtype=float) / np.asarray(eps, dtype=float)
+
+
+def var_X_bar(eps, k):
+    eps = np.asarray(eps, dtype=float)
+    return 1 - eps + np.asarray(k, dtype=float) * eps
+
+
+# This function returns the weight beta on the contaminated part which goes
+# with the weight alpha on the clean part
+def beta_for(alpha, eps):
+    eps = np.asarray(eps, dtype=float)
+    return (1 - (1 - eps) * alpha) / eps
+
+
+def var_X_w(alpha, eps, k):
+    eps = np.asarray(eps, dtype=float)
+    beta = beta_for(alpha, eps)
+    return alpha ** 2 * (1 - eps) + beta ** 2 * eps * np.asarray(k, dtype=float)
+
+
+# The weight alpha minimising the variance of X_w, as shown in the report
+def closed_form_alpha(eps, k):
+    eps = np.asarray(eps, dtype=float)
+    k = np.asarray(k, dtype=float)
+    return k / (k + eps - eps * k)
+
+
+# This function finds the alpha in [0, 1 / (1 - epsilon)] (so that both weights
+# are non-negative) which minimises the variance of X_w, by a golden section
+# search run on every (epsilon, k) at once, to within tol. The variance is flat
+# near its minimum, so alpha cannot be located much closer than the square
+# root of the machine epsilon, which is why tol defaults to 1e-8.
+def optimal_alpha(eps, k, tol=1e-8):
+    eps, k = np.broadcast_arrays(np.asarray(eps, dtype=float), np.asarray(k, dtype=float))
+    lo = np.zeros(eps.shape)
+    hi = 1 / (1 - eps)
+
+    a = hi - _INV_PHI * (hi - lo)
+    b = lo + _INV_PHI * (hi - lo)
+    fa = var_X_w(a, eps, k)
+    fb = var_X_w(b, eps, k)
+
+    while np.max(hi - lo, initial=0) > tol:
+        left = fa < fb
+        # The minimum is in [lo, b] where left, and in [a, hi] otherwise, and
+        # one of the two interior points carries over
+        hi = np.where(left, b, hi)
+        lo = np.where(left, lo, a)
+        a, b = np.where(left, hi - _INV_PHI * (hi - lo), b), np.where(left, a, lo + _INV_PHI * (hi - lo))
+        f_new = var_X_w(np.where(left, a, b), eps, k)
+        fa, fb = np.where(left, f_new, fb), np.where(left, fa, f_new)
+
+    return (lo + hi) / 2
+
+
+# This function returns the variance surfaces and optimal weights on the grid
+# of every eps and k, as (len(eps) x len(k)) arrays
+def variance_surfaces(eps, k, tol=1e-8):
+    E, K = np.meshgrid(np.asarray(eps, dtype=float), np.asarray(k, dtype=float), indexing='ij')
+    alpha = optimal_alpha(E, K, tol)
+    return {
+        'eps': E,
+        'k': K,
+        'X_t': var_X_t(E, K),
+        'X_c': var_X_c(E, K),
+        'X_bar': var_X_bar(E, K),
+        'X_w': var_X_w(alpha, E, K),
+        'alpha': alpha,
+        'beta': beta_for(alpha, E),
+    }
+
+
+@lru_cache(maxsize=32)
+def _cached_surfaces(eps, k, tol):
+    surfaces = variance_surfaces(eps, k, tol)
+    for values in surfaces.values():
+        values.flags.writeable = False
+    return surfaces
+
+
+# This function returns variance_surfaces on the grid, from a cache of recent
+# grids. The arrays returned are read-only, as they are shared between calls.
+def variance_grid(eps, k, tol=1e-8):
+    eps = tuple(np.asarray(eps, dtype=float).ravel().tolist())
+    k = tuple(np.asarray(k, dtype=float).ravel().tolist())
+    return _cached_surfaces(eps, k, tol)
+
+
+# This function refines the grid of eps and k until the surface (one of the
+# names returned by variance_surfaces) is within tol of linear between
+# neighbouring grid lines, by adding the midpoint of every gap where it is not.
+# It stops once either axis would pass max_points, and returns the new axes.
+def refine_grid(eps, k, surface='X_w', tol=1e-3, max_points=2000):
+    axes = [np.unique(np.asarray(eps, dtype=float)), np.unique(np.asarray(k, dtype=float))]
+
+    while True:
+        added = False
+        for axis in (0, 1):
+            grid = axes[axis]
+            mid = (grid[:-1] + grid[1:]) / 2
+            other = axes[1 - axis]
+
+            pair = (mid, other) if axis == 0 else (other, mid)
+            at_mid = variance_surfaces(*pair)[surface]
+            at_ends = variance_grid(*axes)[surface]
+            ends = np.moveaxis(at_ends, axis, 0)
+            error = np.abs(np.moveaxis(at_mid, axis, 0) - (ends[:-1] + ends[1:]) / 2)
+
+            coarse = error.reshape(len(mid), -1).max(axis=1) > tol
+            if coarse.any() and len(grid) + coarse.sum() <= max_points:
+                axes[axis] = np.sort(np.concatenate([grid, mid[coarse]]))
+                added = True
+
+        if not added:
+            return axes[0], axes[1]
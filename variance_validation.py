@@ -0,0 +1,143 @@
+'''
+VARIANCE VALIDATION
+
+In this code we check the closed-form variances of Figure 1.2 (variance_surfaces.py) by Monte
+Carlo. A sample of n points has round(epsilon n) of them drawn from the contaminating N(0, k)
+and the rest from N(0, 1), and the four estimators of location X_t, X_c, X_bar and X_w (with
+the optimal weights from the report) are computed from it. Over many replications the
+empirical value of n Var(estimator) is compared against the formula, with a Monte Carlo
+standard error from the fourth moment of the replicates.
+
+All the grid cells are simulated together. Each chunk of replications draws one
+(replications x n) array of standard normals, shared by every cell, whose running sums give
+the sums of the contaminated and clean parts for every contamination count at once; these
+are then scaled by sqrt(k) and combined into a (epsilon x k x replications) array of
+estimates for each estimator. Only the power sums of the estimates are kept, so memory
+depends on the chunk size, not on the number of replications. Chunks are spread over a
+process pool, each with its own random stream spawned from one SeedSequence, so the result
+does not depend on the number of workers. As the cells share their draws, their errors are
+correlated, so the z-scores of different cells are not independent checks.
+
+'''
+
+
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from bootstrap import map_tasks
+from variance_surfaces import var_X_t, var_X_c, var_X_bar, var_X_w, closed_form_alpha, beta_for
+
+
+# The estimators, in the order they are stored in
+ESTIMATORS = ('X_t', 'X_c', 'X_bar', 'X_w')
+
+# The number of normal draws per chunk, if chunk_reps is not given
+_CHUNK_VALUES = 2 ** 22
+
+
+###############################################################
+#################### Define functions #########################
+###############################################################
+
+# This function simulates one chunk of replications, given as a (seed, number
+# of replications) pair, and returns the sums of the first four powers of
+# sqrt(n) times each estimator, as a (estimators x eps x k x 4) array
+def _validation_chunk(task, n, counts, k, alpha, beta):
+    seed, reps = task
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((reps, n))
+
+    # prefix[:, m] is the sum of the first m draws, which are the contaminated
+    # points of the cells with m of them
+    prefix = np.zeros((reps, n + 1))
+    np.cumsum(z, axis=1, out=prefix[:, 1:])
+    contaminated = prefix[:, counts].T[:, None, :]
+    clean = (prefix[:, n:] - prefix[:, counts]).T[:, None, :]
+
+    root_k = np.sqrt(k)[None, :, None]
+    m = counts[:, None, None]
+    scale = np.sqrt(n)
+    shape = (len(counts), len(k), reps)
+    estimates = (
+        np.broadcast_to(scale * clean / (n - m), shape),
+        scale * root_k * contaminated / m,
+        scale * (clean + root_k * contaminated) / n,
+        scale * (alpha[:, :, None] * clean + beta[:, :, None] * root_k * contaminated) / n,
+    )
+
+    sums = np.empty((len(ESTIMATORS), len(counts), len(k), 4))
+    for i, values in enumerate(estimates):
+        power = np.ones_like(values)
+        for p in range(4):
+            power *= values
+            sums[i, ..., p] = power.sum(axis=-1)
+    return sums
+
+
+# This function turns the power sums of R replicates into their variance and
+# the standard error of that variance
+def _variance_and_se(sums, R):
+    mu = sums[..., 0] / R
+    raw = [sums[..., p] / R for p in range(4)]
+    m2 = raw[1] - mu ** 2
+    m4 = raw[3] - 4 * mu * raw[2] + 6 * mu ** 2 * raw[1] - 3 * mu ** 4
+    variance = m2 * R / (R - 1)
+    se = np.sqrt(np.maximum(m4 - m2 ** 2 * (R - 3) / (R - 1), 0) / R)
+    return variance, se
+
+
+# This function returns a DataFrame comparing n Var(estimator) from reps Monte
+# Carlo replications against the formula, for every (eps, k) on the grid and
+# every estimator, with the Monte Carlo standard error and the z-score of the
+# deviation. The contamination count is round(eps n), and the formulas are
+# evaluated at that count over n (column eps_used), so eps n should be close
+# to a whole number.
+def validate_variances(eps, k, n=150, reps=10 ** 6, seed=None, chunk_reps=None, n_workers=None):
+    eps = np.asarray(eps, dtype=float).ravel()
+    k = np.asarray(k, dtype=float).ravel()
+    counts = np.rint(eps * n).astype(np.intp)
+    if np.any(counts < 1) or np.any(counts > n - 1):
+        raise ValueError(f'every eps * n must round to between 1 and n - 1, got {counts.tolist()}')
+    if chunk_reps is None:
+        chunk_reps = max(1, _CHUNK_VALUES // n)
+
+    eps_used = counts / n
+    E, K = np.meshgrid(eps_used, k, indexing='ij')
+    alpha = closed_form_alpha(E, K)
+    beta = beta_for(alpha, E)
+
+    rows = [min(chunk_reps, reps - start) for start in range(0, reps, chunk_reps)]
+    seeds = np.random.SeedSequence(seed).spawn(len(rows))
+    chunks = map_tasks(partial(_validation_chunk, n=n, counts=counts, k=k, alpha=alpha, beta=beta),
+                       list(zip(seeds, rows)), n_workers, 'process')
+    variance, se = _variance_and_se(sum(chunks), reps)
+
+    formulas = (var_X_t(E, K), var_X_c(E, K), var_X_bar(E, K), var_X_w(alpha, E, K))
+
+    frames = []
+    for i, name in enumerate(ESTIMATORS):
+        frames.append(pd.DataFrame({
+            'eps': np.repeat(eps, len(k)),
+            'eps_used': E.ravel(),
+            'k': K.ravel(),
+            'estimator': name,
+            'n_var': variance[i].ravel(),
+            'formula': formulas[i].ravel(),
+            'deviation': (variance[i] - formulas[i]).ravel(),
+            'se': se[i].ravel(),
+        }))
+    frame = pd.concat(frames, ignore_index=True)
+    frame['z'] = frame['deviation'] / frame['se']
+    return frame
+
+
+if __name__ == '__main__':
+    # The grid of Figure 1.2, with a million replications per cell
+    E = np.arange(1, 31) / 150
+    K = np.arange(1, 6)
+
+    report = validate_variances(E, K, n=150, reps=10 ** 6, seed=0)
+    print(report.to_string())
+    print('Largest |z|:', report['z'].abs().max())
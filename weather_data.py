@@ -0,0 +1,197 @@
+'''
+WEATHER DATA
+
+In this code we read weather station logs such as the JCMB 15 minute readings used in
+weather_simulation.py: a CSV file with a header line, a date-time in the first field and
+numeric readings in the rest. The file is read in blocks of bytes, so memory stays bounded
+however long the log is, and each block is parsed into a datetime64 column and a 2-D float
+array of readings. Per-day aggregates (count, sum, mean, min, max of every column) are then
+computed with a vectorised group-by, and merged across blocks, so logs spanning several
+years work the same way as a single year.
+
+The parsed columns can also be cached as raw binary files next to the source the first time
+it is read, after which they are memory-mapped instead of parsed again.
+
+'''
+
+
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# The format of the date-time field in the JCMB logs, e.g. 2012/01/01 00:15
+DATE_FORMAT = '%Y/%m/%d %H:%M'
+
+# The default number of bytes read at a time
+CHUNK_BYTES = 2 ** 24
+
+
+###############################################################
+######################## Parsing ##############################
+###############################################################
+
+# This function returns the names of the reading columns of a log (the header
+# fields after the date-time) and the byte offset where the data starts
+def read_header(path):
+    with open(path, 'rb') as f:
+        header = f.readline()
+    names = [name.strip() for name in header.decode().strip().split(',')[1:]]
+    return names, len(header)
+
+
+# This function parses a block of complete CSV lines into the times and a
+# (rows x columns) float array of readings. Fields which are not numbers
+# become NaN.
+def parse_block(block, n_columns, date_format=DATE_FORMAT):
+    frame = pd.read_csv(io.BytesIO(block), header=None, names=range(n_columns + 1),
+                        dtype={0: str}, skipinitialspace=True)
+    times = pd.to_datetime(frame[0], format=date_format).to_numpy(dtype='datetime64[s]')
+    values = frame.iloc[:, 1:].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    return times, values
+
+
+# This function reads a log in blocks of about chunk_bytes, from the byte offset
+# start (the start of the data by default), yielding (times, values, end) for
+# each block, where end is the byte offset just after its last complete line.
+# A final line without a newline is only read if include_partial is True.
+def iter_chunks(path, start=None, chunk_bytes=CHUNK_BYTES, date_format=DATE_FORMAT,
+                include_partial=True):
+    names, data_start = read_header(path)
+    offset = data_start if start is None else start
+
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        leftover = b''
+        while True:
+            block = f.read(chunk_bytes)
+            if not block:
+                break
+            block = leftover + block
+            cut = block.rfind(b'\n') + 1
+            leftover = block[cut:]
+            if cut > 0 and block[:cut].strip():
+                offset += cut
+                yield (*parse_block(block[:cut], len(names), date_format), offset)
+
+        if include_partial and leftover.strip():
+            offset += len(leftover)
+            yield (*parse_block(leftover, len(names), date_format), offset)
+
+
+###############################################################
+######################## Caching ##############################
+###############################################################
+
+# This function returns the times, readings and column names of a log. With a
+# cache directory, the parsed columns are written there as raw binary files
+# on the first call, and memory-mapped on later calls (as long as the source
+# file has not changed), so the CSV is only parsed once.
+def load_columns(path, cache_dir=None, chunk_bytes=CHUNK_BYTES, date_format=DATE_FORMAT):
+    names, _ = read_header(path)
+    if cache_dir is None:
+        chunks = list(iter_chunks(path, chunk_bytes=chunk_bytes, date_format=date_format))
+        if not chunks:
+            return np.empty(0, dtype='datetime64[s]'), np.empty((0, len(names))), names
+        return (np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks]), names)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path = os.path.join(cache_dir, 'meta.json')
+    times_path = os.path.join(cache_dir, 'times.i8')
+    values_path = os.path.join(cache_dir, 'values.f8')
+    stat = os.stat(path)
+    source = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    if meta is None or meta['source'] != source:
+        rows = 0
+        with open(times_path, 'wb') as times_file, open(values_path, 'wb') as values_file:
+            for times, values, _ in iter_chunks(path, chunk_bytes=chunk_bytes, date_format=date_format):
+                times.astype(np.int64).tofile(times_file)
+                np.ascontiguousarray(values).tofile(values_file)
+                rows += len(times)
+        meta = {'source': source, 'columns': names, 'rows': rows}
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+
+    rows = meta['rows']
+    if rows == 0:
+        return np.empty(0, dtype='datetime64[s]'), np.empty((0, len(names))), meta['columns']
+    times = np.memmap(times_path, dtype=np.int64, mode='r', shape=(rows,)).view('datetime64[s]')
+    values = np.memmap(values_path, dtype=float, mode='r', shape=(rows, len(meta['columns'])))
+    return times, values, meta['columns']
+
+
+###############################################################
+################### Daily aggregation #########################
+###############################################################
+
+# This function groups readings by day, returning the days and the count, sum,
+# min and max of the non-missing readings of every column on each day, as
+# (days x columns) arrays
+def group_by_day(times, values):
+    days = np.asarray(times).astype('datetime64[D]')
+    values = np.asarray(values, dtype=float)
+    if len(days) == 0:
+        return (days,) + tuple(np.empty((0, values.shape[1])) for _ in range(4))
+    order = np.argsort(days, kind='stable')
+    days = days[order]
+    values = values[order]
+
+    unique_days, starts = np.unique(days, return_index=True)
+    present = ~np.isnan(values)
+    count = np.add.reduceat(present.astype(np.int64), starts, axis=0)
+    total = np.add.reduceat(np.where(present, values, 0.0), starts, axis=0)
+    low = np.fmin.reduceat(values, starts, axis=0)
+    high = np.fmax.reduceat(values, starts, axis=0)
+
+    return unique_days, count, total, low, high
+
+
+# This function merges daily aggregates of the form returned by group_by_day
+# (e.g. from different blocks of a file), combining days which appear in more
+# than one of them
+def merge_daily(parts):
+    days = np.concatenate([p[0] for p in parts])
+    order = np.argsort(days, kind='stable')
+    days = days[order]
+    unique_days, starts = np.unique(days, return_index=True)
+
+    def combine(i, reduce):
+        return reduce.reduceat(np.concatenate([p[i] for p in parts])[order], starts, axis=0)
+
+    return (unique_days, combine(1, np.add), combine(2, np.add), combine(3, np.fmin),
+            combine(4, np.fmax))
+
+
+# This function returns the per-day aggregates of every column of a log, as a
+# dict with the days, the column names, and (days x columns) arrays of the
+# count, sum, mean, min and max of the readings. The log is read in blocks,
+# or from the memory-mapped cache if cache_dir is given.
+def daily_aggregates(path, cache_dir=None, chunk_bytes=CHUNK_BYTES, date_format=DATE_FORMAT):
+    names, _ = read_header(path)
+
+    if cache_dir is None:
+        parts = [group_by_day(times, values)
+                 for times, values, _ in iter_chunks(path, chunk_bytes=chunk_bytes, date_format=date_format)]
+    else:
+        times, values, names = load_columns(path, cache_dir, chunk_bytes, date_format)
+        rows = max(1, chunk_bytes // (8 * (len(names) + 1)))
+        parts = [group_by_day(times[i:i + rows], values[i:i + rows]) for i in range(0, len(times), rows)]
+
+    if not parts:
+        parts = [(np.empty(0, dtype='datetime64[D]'),) + tuple(np.empty((0, len(names))) for _ in range(4))]
+
+    days, count, total, low, high = merge_daily(parts) if len(parts) > 1 else parts[0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+
+    return {'days': days, 'columns': names, 'count': count, 'sum': total, 'mean': mean,
+            'min': low, 'max': high}
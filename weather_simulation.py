@@ -19,70 +19,50 @@ import numpy as np
 from numpy import random
 from scipy.stats.mstats import winsorize
 
+from daily_index import DailyIndex
+from order_stats import QuantileSummary
+
 
 # A function which takes a data set and scale and uses the median
-# and IQR to create bounds, returning the Winsorized data set
+# and IQR to create bounds, returning the Winsorized data set (the data is
+# changed in place)
 def winsorize(data, scale):
-    median = np.median(data)
-    Q1 = np.percentile(data, 25)
-    Q3 = np.percentile(data, 75)
-    IQR = Q3 - Q1
-
-    cminus = median - scale*IQR
-    cplus = median + scale*IQR
-
-    for i in range(len(data)):
-        if data[i] < cminus:
-            data[i] = cminus
-        if data[i] > cplus:
-            data[i] = cplus    
+    data[:] = QuantileSummary(data).winsorize(scale)
 
     return data
 
 
-# Access the file in read only mode (from my files)
-f = open("C:\\Users\\gabri\\Downloads\\JCMB_2012.csv","r")
-
-
-# We will store the mean of the temperature for each day
-day_means = []
+if __name__ == '__main__':
+    # The file (from my files) is averaged by day into an index saved next to
+    # it (see daily_index.py), which only reads readings added since last time.
+    # The 2012 log is finished, so a last reading without a newline is counted.
+    path = "C:\\Users\\gabri\\Downloads\\JCMB_2012.csv"
+    daily = DailyIndex.open(path, include_partial=True)
 
-day = "2012/01/01"
-day_store = []
-# Extract the data from the file into the list
-k = f.readlines()
-for line in k[1:]:
-    line_split = line.split(",")
-    day_split = line_split[0].split(" ")
-    #print()
-    if day_split[0] == day:
-        day_store.append(float(line_split[5]))
-    else:
-        #print(day)
-        day_means.append((sum(day_store)/(len(day_store))))
-        day_store = []
-        day = day_split[0]
+    # We will store the mean of the temperature (field 5 of each line, after
+    # the date) for each day
+    day_means = list(daily.mean[:, 4])
 
 
-# The additional heatwave data
-heatwave = [31, 27, 24, 25, 29, 31, 37, 40]
+    # The additional heatwave data
+    heatwave = [31, 27, 24, 25, 29, 31, 37, 40]
 
-# Print out the results
-print('REGULAR')
-print(np.mean(day_means))
-print(np.median(day_means))
-wins = winsorize(np.array(day_means), 1.7)
+    # Print out the results
+    print('REGULAR')
+    print(np.mean(day_means))
+    print(np.median(day_means))
+    wins = winsorize(np.array(day_means), 1.7)
 
-print(np.mean(wins))
+    print(np.mean(wins))
 
-# Combine the two data sets
-for i in heatwave:
-    day_means.append(i)
+    # Combine the two data sets
+    for i in heatwave:
+        day_means.append(i)
 
-print('HEATWAVE ADDED')
-print(np.mean(day_means))
-print(np.median(day_means))
+    print('HEATWAVE ADDED')
+    print(np.mean(day_means))
+    print(np.median(day_means))
 
-wins = winsorize(np.array(day_means), 1.7)
+    wins = winsorize(np.array(day_means), 1.7)
 
-print(np.mean(wins))
\ No newline at end of file
+    print(np.mean(wins))